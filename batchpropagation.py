@@ -0,0 +1,151 @@
+#! /usr/bin/env python
+
+# File: batchpropagation
+# Propagating the sudoku rules on many puzzles at once with numpy.
+# Authors:  Georgi Terziev      g.d.terziev@gmail.com
+#           Kasper Bouwens      kas_bouwens@hotmail.com
+
+import math
+from search import SOLVED
+from restarts import RestartingSearch, UNKNOWN
+from stats import SolverStatistics
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class BatchPropagator:
+    """Constraint propagation for a batch of sudokus of the same size.
+
+    The batch is a boolean tensor of candidates, puzzles x cells x values.
+    Every round removes the values of the assigned cells from their rows,
+    columns and boxes, assigns the hidden singles (values with only one
+    place left in a row, column or box) and detects the contradictions,
+    all as vectorized operations over the whole batch.
+    The rounds are repeated until the candidates stop changing.
+
+    Requires numpy."""
+
+    def __init__(self, size):
+        if numpy is None:
+            raise Exception('BatchPropagator', 'numpy is required for the vectorized propagation')
+
+        self.size = size
+        subgrid_size = int(math.sqrt(size))
+        cells = numpy.arange(size * size).reshape(size, size)
+        boxes = cells.reshape(subgrid_size, subgrid_size, subgrid_size, subgrid_size)
+        boxes = boxes.transpose(0, 2, 1, 3).reshape(size, size)
+        #every unit type (rows, columns, boxes) covers every cell exactly once
+        self.unit_types = [cells.ravel(), cells.T.ravel(), boxes.ravel()]
+        #the position of every cell in the flattened units of a type
+        self.cell_positions = [numpy.argsort(units) for units in self.unit_types]
+
+    def candidates(self, grids):
+        """Returns the candidates tensor of the grids.
+
+        grids is a puzzles x cells array of the given values, 0 for the unset cells."""
+
+        given = grids > 0
+        values = numpy.arange(1, self.size + 1)
+        return numpy.where(given[:, :, None], grids[:, :, None] == values, True)
+
+    def propagate(self, candidates):
+        """Propagates the sudoku rules on the candidates tensor.
+
+        Returns the propagated candidates and a boolean array marking
+        the puzzles that turned out to have no solution."""
+
+        npuzzles = candidates.shape[0]
+        size = self.size
+        ncells = size * size
+        contradiction = numpy.zeros(npuzzles, dtype=bool)
+        while True:
+            counts = candidates.sum(axis=2)
+            assigned = counts == 1
+            contradiction |= (counts == 0).any(axis=1)
+            assigned_values = candidates & assigned[:, :, None]
+
+            removed = numpy.zeros_like(candidates)
+            hidden = numpy.zeros_like(candidates)
+            for units, positions in zip(self.unit_types, self.cell_positions):
+                unit_assigned = assigned_values[:, units, :].reshape(npuzzles, size, size, size)
+                assigned_count = unit_assigned.sum(axis=2)
+                #the same value assigned twice in a unit
+                contradiction |= (assigned_count > 1).any(axis=(1, 2))
+                unit_removed = numpy.repeat(assigned_count > 0, size, axis=1)
+                removed |= unit_removed[:, positions, :]
+
+                unit_candidates = candidates[:, units, :].reshape(npuzzles, size, size, size)
+                value_count = unit_candidates.sum(axis=2)
+                #a value with no place left in a unit
+                contradiction |= (value_count == 0).any(axis=(1, 2))
+                unit_hidden = unit_candidates & (value_count == 1)[:, :, None, :]
+                hidden |= unit_hidden.reshape(npuzzles, ncells, size)[:, positions, :]
+
+            #the assigned cells keep their own values
+            new_candidates = candidates & ~(removed & ~assigned[:, :, None])
+            has_hidden = hidden.any(axis=2)
+            new_candidates = numpy.where(has_hidden[:, :, None], new_candidates & hidden, new_candidates)
+
+            if numpy.array_equal(new_candidates, candidates):
+                break
+            candidates = new_candidates
+
+        return candidates, contradiction
+
+def solve_sudokus_vectorized(sudoku_translator, sudoku_strings, timing=False, limits=None, exact_cover=True, **options):
+    """Solves a batch of sudokus.
+
+    Propagates all the sudokus of the same size at once with a BatchPropagator.
+    Only the ones that are neither solved nor contradicted by that are
+    searched, starting from the propagated domains: as exact cover problems
+    by dlx.ExactCover if exact_cover is set and there are no options,
+    otherwise by search.Search with the options (see restarts.RestartingSearch).
+    Returns a list with the solution string and the stats.SolverStatistics of every sudoku,
+    the statistics of the sudokus solved by the batch propagation are all zero.
+    With timing the statistics include the times of the search phases.
+    With limits (see cspsolver.solve_CSP_within_limits) the search of a sudoku
+    may be given up, then its solution string is 'Unknown.'."""
+
+    results = [None] * len(sudoku_strings)
+    by_length = dict()
+    for i, sudoku_string in enumerate(sudoku_strings):
+        by_length.setdefault(len(sudoku_string), []).append(i)
+
+    unset_values = sudoku_translator.unset_values
+    value_characters = sudoku_translator.value_characters
+    for length, indices in by_length.iteritems():
+        size = int(round(math.sqrt(length)))
+        subgrid_size = int(round(math.sqrt(size)))
+        if size * size != length or subgrid_size * subgrid_size != size:
+            raise Exception('solve_sudokus_vectorized', 'Sudoku size must be a square number')
+
+        grids = numpy.array([[0 if value in unset_values else sudoku_translator.character_value(value) for value in sudoku_strings[i]]
+                             for i in indices], dtype=int).reshape(len(indices), length)
+        propagator = BatchPropagator(size)
+        candidates, contradiction = propagator.propagate(propagator.candidates(grids))
+        solved = (candidates.sum(axis=2) == 1).all(axis=1) & ~contradiction
+        domain_masks = (candidates * (1 << numpy.arange(size))).sum(axis=2)
+        grid_values = candidates.argmax(axis=2) + 1
+
+        for k, i in enumerate(indices):
+            if contradiction[k]:
+                results[i] = ('No solution.', SolverStatistics(timing))
+            elif solved[k]:
+                results[i] = (''.join(value_characters[value - 1] for value in grid_values[k]), SolverStatistics(timing))
+            else:
+                csp = sudoku_translator.create_CSP(size, map(int, domain_masks[k]))
+                search_options = dict(options)
+                if limits is not None:
+                    search_options.update(limits)
+                search = RestartingSearch(csp, statistics=SolverStatistics(timing), exact_cover=exact_cover, **search_options)
+                status = search.run()
+                if status == SOLVED:
+                    results[i] = (sudoku_translator.translate_solution(search.solution), search.statistics)
+                elif status == UNKNOWN:
+                    results[i] = ('Unknown.', search.statistics)
+                else:
+                    results[i] = ('No solution.', search.statistics)
+
+    return results
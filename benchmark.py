@@ -0,0 +1,508 @@
+#! /usr/bin/env python
+
+# File: benchmark
+# Benchmarks of the solver on graded corpora of sudokus.
+# Authors:  Georgi Terziev      g.d.terziev@gmail.com
+#           Kasper Bouwens      kas_bouwens@hotmail.com
+
+import sys
+import os
+import ast
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import itertools
+import resource
+import multiprocessing
+from sudoku import Sudoku
+from search import Search, SOLVED, UNSATISFIABLE
+from restarts import RestartingSearch
+from portfolio import DEFAULT_PORTFOLIO
+from csproblem import OPTIMIZED_PROPAGATION, QUEUE_PROPAGATION
+from stats import SolverStatistics
+
+SOURCE_FILE = '1000 sudokus.txt'
+"""The file the 9x9 corpora are graded from."""
+
+CORPORA = ['easy', 'hard', 'minimal', '16x16', '25x25', 'unsat']
+
+CORPUS_SIZES = {'easy': 50, 'hard': 50, 'minimal': 20, '16x16': 10, '25x25': 3, 'unsat': 30}
+"""The default number of puzzles of every corpus."""
+
+GIVEN_FRACTIONS = {16: 0.5, 25: 0.55}
+"""The fraction of the cells that are given in the generated large puzzles."""
+
+SWEEP = [('optimized', [OPTIMIZED_PROPAGATION, QUEUE_PROPAGATION]),
+         ('use_mrv', [True, False]),
+         ('use_mcv', [False, True]),
+         ('sort_values', [1, 0, 2])]
+"""The solve_CSP options swept by --sweep and their values."""
+
+METRICS = ['splits', 'nodes', 'propagations', 'time', 'peak_memory_kb']
+"""The metrics compared against the baseline, lower is better for all."""
+
+def solved_grid(size, rng):
+    """Returns a random solved sudoku of the given size, as a list of the values of the cells.
+
+    Starts from a pattern that is a valid sudoku for every size and shuffles it
+    with the transformations that keep it valid: relabeling the values,
+    permuting the bands and the rows within a band, the stacks and the
+    columns within a stack, and transposing."""
+
+    box = int(round(math.sqrt(size)))
+
+    def shuffled_lines():
+        lines = []
+        for band in rng.sample(range(box), box):
+            lines.extend(band * box + line for line in rng.sample(range(box), box))
+        return lines
+
+    rows = shuffled_lines()
+    columns = shuffled_lines()
+    labels = rng.sample(range(1, size + 1), size)
+    if rng.random() < 0.5:
+        rows, columns = columns, rows
+
+    return [labels[(box * (row % box) + row / box + column) % size] for row in rows for column in columns]
+
+def puzzle_string(translator, values):
+    """Returns the sudoku string of a list of values, 0 for the unset cells."""
+
+    return ''.join(translator.value_characters[value - 1] if value else '.' for value in values)
+
+def puzzle_values(translator, sudoku_string):
+    """Returns the values of a sudoku string as a list, 0 for the unset cells."""
+
+    return [0 if character in translator.unset_values else translator.character_value(character)
+            for character in sudoku_string]
+
+def has_other_solution(translator, values, cell, value):
+    """Tells if the puzzle has a solution in which the cell does not have the value."""
+
+    size = int(round(math.sqrt(len(values))))
+    domain_masks = translator.initialize_domain_masks(puzzle_string(translator, values), size)
+    domain_masks[cell] &= ~(1 << (value - 1))
+    return Search(translator.create_CSP(size, domain_masks)).run() == SOLVED
+
+def minimal_puzzle(translator, grid, rng):
+    """Removes clues from a solved grid while the puzzle keeps a unique solution.
+
+    The clues are tried in random order. A clue can go if no solution
+    has a different value in its cell, then the solution stays unique.
+    The result is minimal: none of its clues can be removed."""
+
+    values = list(grid)
+    for cell in rng.sample(range(len(values)), len(values)):
+        value = values[cell]
+        values[cell] = 0
+        if has_other_solution(translator, values, cell, value):
+            values[cell] = value
+
+    return values
+
+def generated_puzzle(grid, rng, given_fraction):
+    """Keeps a random given_fraction of the cells of a solved grid.
+
+    The puzzle is satisfiable but its solution need not be unique."""
+
+    ncells = len(grid)
+    values = [0] * ncells
+    for cell in rng.sample(range(ncells), int(round(ncells * given_fraction))):
+        values[cell] = grid[cell]
+
+    return values
+
+def unsatisfiable_puzzle(translator, values, solution, rng):
+    """Adds a wrong clue to a puzzle with a unique solution.
+
+    The clue does not repeat a given of its row, column or box,
+    so the contradiction is only found by search.
+    Returns None if every such clue still leaves a solution."""
+
+    size = int(round(math.sqrt(len(values))))
+    box = int(round(math.sqrt(size)))
+    empty_cells = [cell for cell, value in enumerate(values) if value == 0]
+    for cell in rng.sample(empty_cells, len(empty_cells)):
+        row, column = cell / size, cell % size
+        peers = set()
+        for other in range(size):
+            peers.add(values[row * size + other])
+            peers.add(values[other * size + column])
+        box_row, box_column = row / box * box, column / box * box
+        for other_row in range(box_row, box_row + box):
+            for other_column in range(box_column, box_column + box):
+                peers.add(values[other_row * size + other_column])
+
+        candidates = [value for value in range(1, size + 1) if value not in peers and value != solution[cell]]
+        if not candidates:
+            continue
+        wrong = list(values)
+        wrong[cell] = rng.choice(candidates)
+        csp = translator.translate_sudoku_to_CSP(puzzle_string(translator, wrong))
+        if Search(csp).run() == UNSATISFIABLE:
+            return wrong
+
+    return None
+
+def grade(translator, sudoku_strings):
+    """Solves the sudokus with the default options of solve_CSP.
+
+    Returns a list of (nodes, index, solution values) of the solved ones."""
+
+    graded = []
+    for index, sudoku_string in enumerate(sudoku_strings):
+        search = Search(translator.translate_sudoku_to_CSP(sudoku_string))
+        if search.run() == SOLVED:
+            solution = [min(search.solution[cell]) for cell in range(len(sudoku_string))]
+            graded.append((search.statistics.nodes, index, solution))
+
+    return graded
+
+def build_corpora(source_file, sizes, seed):
+    """Builds the corpora, returns a dict mapping their names to lists of sudoku strings.
+
+    easy    - the sudokus of the source file that take the fewest nodes.
+    hard    - the sudokus of the source file that take the most nodes.
+    minimal - random 9x9 sudokus with a unique solution and no clue to spare.
+    16x16   - random 16x16 sudokus, see generated_puzzle.
+    25x25   - random 25x25 sudokus.
+    unsat   - sudokus of the source file with a wrong clue, see unsatisfiable_puzzle.
+
+    Only the corpora in sizes are built, with the given number of sudokus.
+    The same seed builds the same corpora."""
+
+    rng = random.Random(seed)
+    translator = Sudoku()
+    global_translator = Sudoku(True)
+    corpora = dict()
+
+    if set(sizes) & {'easy', 'hard', 'unsat'}:
+        with open(source_file, 'r') as source:
+            sudoku_strings = [line.strip() for line in source if line.strip()]
+        graded = grade(translator, sudoku_strings)
+        by_nodes = sorted(graded, key=lambda entry: (entry[0], entry[1]))
+        if 'easy' in sizes:
+            easy = sorted(index for nodes, index, solution in by_nodes[:sizes['easy']])
+            corpora['easy'] = [sudoku_strings[index] for index in easy]
+        if 'hard' in sizes:
+            hard = sorted(index for nodes, index, solution in by_nodes[len(by_nodes) - sizes['hard']:])
+            corpora['hard'] = [sudoku_strings[index] for index in hard]
+        if 'unsat' in sizes:
+            corpora['unsat'] = []
+            for nodes, index, solution in rng.sample(graded, len(graded)):
+                if len(corpora['unsat']) == sizes['unsat']:
+                    break
+                values = puzzle_values(translator, sudoku_strings[index])
+                wrong = unsatisfiable_puzzle(global_translator, values, solution, rng)
+                if wrong is not None:
+                    corpora['unsat'].append(puzzle_string(translator, wrong))
+
+    if 'minimal' in sizes:
+        corpora['minimal'] = [puzzle_string(translator, minimal_puzzle(global_translator, solved_grid(9, rng), rng))
+                              for i in range(sizes['minimal'])]
+
+    for size in (16, 25):
+        name = '%dx%d' % (size, size)
+        if name in sizes:
+            corpora[name] = [puzzle_string(translator, generated_puzzle(solved_grid(size, rng), rng, GIVEN_FRACTIONS[size]))
+                             for i in range(sizes[name])]
+
+    return corpora
+
+def load_corpora(directory, names, sizes, source_file, seed):
+    """Returns the corpora with the given names, as a dict of lists of sudoku strings.
+
+    The corpora are read from directory, one file per corpus with a sudoku
+    per line. The missing ones are built and stored there first."""
+
+    corpora = dict()
+    missing = dict()
+    for name in names:
+        path = os.path.join(directory, name + '.txt')
+        if os.path.exists(path):
+            with open(path, 'r') as corpus_file:
+                corpora[name] = [line.strip() for line in corpus_file if line.strip()]
+        else:
+            missing[name] = sizes[name]
+
+    if missing:
+        print >> sys.stderr, 'Building corpora: ' + ', '.join(sorted(missing))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name, sudoku_strings in build_corpora(source_file, missing, seed).iteritems():
+            with open(os.path.join(directory, name + '.txt'), 'w') as corpus_file:
+                for sudoku_string in sudoku_strings:
+                    corpus_file.write(sudoku_string + '\n')
+            corpora[name] = sudoku_strings
+
+    return corpora
+
+def is_valid_solution(translator, sudoku_string, solution):
+    """Tells if the solution (a dict of variable domains) solves the sudoku."""
+
+    size = int(round(math.sqrt(len(sudoku_string))))
+    values = [min(solution[cell]) for cell in range(len(sudoku_string))]
+    for cell, given in enumerate(puzzle_values(translator, sudoku_string)):
+        if given and values[cell] != given:
+            return False
+
+    template = translator.get_template(size)
+    for constraint_type, variables in template.constraints:
+        for first, second in itertools.combinations(variables, 2):
+            if values[first] == values[second]:
+                return False
+
+    return True
+
+def solve_corpus(sudoku_strings, options, node_limit, time_limit):
+    """Solves the sudokus of a corpus with the options.
+
+    options are the ones of restarts.RestartingSearch (the restart schedule,
+    scale, seed and exact_cover) and search.Search, plus global_constraints
+    of the translator. A sudoku is given up (counted as unknown) after node_limit
+    nodes or time_limit seconds, None for no limit.
+    Returns a dict with the counts of the outcomes, the wall time, the peak
+    memory and the totals of the counters of stats.SolverStatistics."""
+
+    options = dict(options)
+    translator = Sudoku(options.pop('global_constraints', False))
+    for size in set(int(round(math.sqrt(len(sudoku_string)))) for sudoku_string in sudoku_strings):
+        #the constraints are built once per size, not part of the measurement
+        translator.get_template(size)
+
+    result = {'puzzles': len(sudoku_strings), 'solved': 0, 'unsatisfiable': 0, 'unknown': 0, 'invalid': 0}
+    total = SolverStatistics()
+    start_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    for sudoku_string in sudoku_strings:
+        search = RestartingSearch(translator.translate_sudoku_to_CSP(sudoku_string), node_limit, time_limit, **options)
+        status = search.run()
+        total.merge(search.statistics)
+        if status == SOLVED:
+            result['solved'] += 1
+            if not is_valid_solution(translator, sudoku_string, search.solution):
+                result['invalid'] += 1
+        elif status == UNSATISFIABLE:
+            result['unsatisfiable'] += 1
+        else:
+            result['unknown'] += 1
+
+    result['time'] = time.time() - start
+    for counter, value in total.as_dict().iteritems():
+        if counter != 'time':
+            result[counter] = value
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['peak_memory_kb'] = peak_memory
+    result['memory_growth_kb'] = peak_memory - start_memory
+    return result
+
+def solve_corpus_in_child(connection, sudoku_strings, options, node_limit, time_limit):
+    connection.send(solve_corpus(sudoku_strings, options, node_limit, time_limit))
+    connection.close()
+
+def run_in_child(sudoku_strings, options, node_limit, time_limit):
+    """Runs solve_corpus in a new process, so that its peak memory is its own."""
+
+    parent_connection, child_connection = multiprocessing.Pipe(False)
+    process = multiprocessing.Process(target=solve_corpus_in_child,
+                                      args=(child_connection, sudoku_strings, options, node_limit, time_limit))
+    process.start()
+    child_connection.close()
+    try:
+        result = parent_connection.recv()
+    except EOFError:
+        raise Exception('run_in_child', 'The benchmark process died, exit code ' + str(process.exitcode))
+    process.join()
+    return result
+
+def configuration_name(options):
+    """Returns a short name of a configuration, its options as key=value pairs."""
+
+    return ','.join('%s=%s' % (key, options[key]) for key in sorted(options)) or 'default'
+
+def configurations(sweep):
+    """Returns every combination of the values in sweep, a list of (option, values) pairs."""
+
+    keys = [key for key, values in sweep]
+    return [dict(zip(keys, combination)) for combination in itertools.product(*[values for key, values in sweep])]
+
+def parse_sweep(arguments):
+    """Parses --set arguments of the form option=value1,value2,... to a sweep."""
+
+    sweep = []
+    for argument in arguments:
+        key, separator, values = argument.partition('=')
+        if not separator:
+            raise Exception('parse_sweep', 'Expected option=value1,value2,... got ' + argument)
+        sweep.append((key, [ast.literal_eval(value) for value in values.split(',')]))
+
+    return sweep
+
+def run_benchmarks(corpora, names, configurations, node_limit, time_limit):
+    """Runs every configuration on every corpus, returns the list of result records."""
+
+    records = []
+    for options in configurations:
+        for name in names:
+            record = {'corpus': name, 'configuration': configuration_name(options), 'options': options}
+            record.update(run_in_child(corpora[name], options, node_limit, time_limit))
+            records.append(record)
+            print_record(record)
+
+    return records
+
+def tune(records, metric):
+    """Picks the best configuration for every corpus.
+
+    The best one solved no sudoku wrong, gave up on the fewest and has the
+    lowest metric among those. Returns a dict from the corpora to the
+    options of their best configurations."""
+
+    best = dict()
+    for record in records:
+        key = (record['invalid'] > 0, record['unknown'], record[metric])
+        corpus = record['corpus']
+        if corpus not in best or key < best[corpus][0]:
+            best[corpus] = (key, record)
+
+    return dict((corpus, record['options']) for corpus, (key, record) in best.iteritems())
+
+def tuned_portfolio(best, metric):
+    """Returns the portfolio file contents of the best configurations found by tune.
+
+    configurations are the distinct best ones, for portfolio.load_portfolio.
+    global_constraints is left out of them: it belongs to the translator,
+    not to the search of a portfolio."""
+
+    portfolio = []
+    for corpus in sorted(best):
+        options = dict((key, value) for key, value in best[corpus].iteritems() if key != 'global_constraints')
+        if options not in portfolio:
+            portfolio.append(options)
+
+    return {'metric': metric, 'corpora': best, 'configurations': portfolio}
+
+def print_record(record):
+    print '%-8s %-50s solved %3d unsat %3d unknown %3d invalid %d  splits %7d nodes %7d propagations %7d  %8.3fs %7d KB' % (
+        record['corpus'], record['configuration'], record['solved'], record['unsatisfiable'], record['unknown'],
+        record['invalid'], record['splits'], record['nodes'], record['propagations'], record['time'],
+        record['peak_memory_kb'])
+    sys.stdout.flush()
+
+def compare(records, baseline_records, threshold):
+    """Compares the results to a baseline.
+
+    Returns the number of benchmarks found in both and a list of messages
+    about the regressions: a metric that grew by more than the threshold
+    (a fraction) or a change in the outcome counts."""
+
+    results = dict(((record['corpus'], record['configuration']), record) for record in records)
+    regressions = []
+    compared = 0
+    for baseline in baseline_records:
+        key = (baseline['corpus'], baseline['configuration'])
+        record = results.get(key)
+        if record is None:
+            continue
+        compared += 1
+        name = '%s %s' % key
+        for outcome in ('solved', 'unsatisfiable', 'unknown', 'invalid'):
+            if record[outcome] != baseline[outcome]:
+                regressions.append('%s: %s changed from %d to %d' % (name, outcome, baseline[outcome], record[outcome]))
+        for metric in METRICS:
+            old, new = baseline[metric], record[metric]
+            if new > old * (1 + threshold):
+                change = 'inf' if old == 0 else '%+.1f%%' % (100.0 * (new - old) / old)
+                regressions.append('%s: %s regressed from %s to %s (%s)' % (name, metric, old, new, change))
+
+    return compared, regressions
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmark.py', description='Benchmarks the solver on graded corpora of sudokus.')
+    parser.add_argument('-c', '--corpora', default=','.join(CORPORA),
+                        help='comma separated corpora to run (default all: %(default)s)')
+    parser.add_argument('--corpora-dir', default='benchmarks',
+                        help='directory the corpora are stored in, missing ones are built there')
+    parser.add_argument('--source', default=SOURCE_FILE,
+                        help='the sudokus the 9x9 corpora are graded from')
+    parser.add_argument('--seed', type=int, default=2016,
+                        help='the seed of the generated corpora')
+    parser.add_argument('--sweep', action='store_true',
+                        help='sweep the solve_CSP options: ' + ' '.join('%s=%s' % (key, values) for key, values in SWEEP))
+    parser.add_argument('--set', action='append', default=[], metavar='OPTION=VALUES',
+                        help='sweep a search option (or global_constraints) over comma separated values')
+    parser.add_argument('--node-limit', type=int, default=None,
+                        help='give up a sudoku after this many nodes')
+    parser.add_argument('--time-limit', type=float, default=10.0,
+                        help='give up a sudoku after this many seconds (default %(default)s, 0 for no limit)')
+    parser.add_argument('-o', '--output', default='benchmark_results.json',
+                        help='the file the results are written to, as JSON')
+    parser.add_argument('-b', '--baseline',
+                        help='a results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='the fraction a metric may grow by before it counts as a regression')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--tune', metavar='FILE',
+                        help='also run the configurations of the default portfolio, pick the best configuration '
+                             'of every corpus and write them to FILE for cspsolver.py --portfolio')
+    parser.add_argument('--tune-metric', choices=METRICS, default='time',
+                        help='the metric the best configuration has the lowest of (default %(default)s)')
+    args = parser.parse_args(argv[1:])
+
+    names = [name for name in args.corpora.split(',') if name]
+    for name in names:
+        if name not in CORPUS_SIZES:
+            parser.error('unknown corpus ' + name)
+
+    sweep = list(SWEEP) if args.sweep else []
+    sweep.extend(parse_sweep(args.set))
+    time_limit = args.time_limit or None
+
+    corpora = load_corpora(args.corpora_dir, names, CORPUS_SIZES, args.source, args.seed)
+    candidates = configurations(sweep)
+    if args.tune is not None:
+        candidates.extend(options for options in DEFAULT_PORTFOLIO if options not in candidates)
+    records = run_benchmarks(corpora, names, candidates, args.node_limit, time_limit)
+    results = {'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'node_limit': args.node_limit,
+               'time_limit': time_limit,
+               'results': records}
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.tune is not None:
+        best = tune(records, args.tune_metric)
+        for name in names:
+            print 'BEST %-8s %s' % (name, configuration_name(best[name]))
+        with open(args.tune, 'w') as portfolio_file:
+            json.dump(tuned_portfolio(best, args.tune_metric), portfolio_file, indent=2, sort_keys=True)
+
+    status = 0
+    if args.baseline is not None:
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r') as baseline_file:
+                baseline = json.load(baseline_file)
+            compared, regressions = compare(records, baseline['results'], args.threshold)
+            for regression in regressions:
+                print 'REGRESSION ' + regression
+            if regressions:
+                status = 1
+            print '%d regressions in %d benchmarks compared with %s' % (len(regressions), compared, args.baseline)
+        elif not args.update_baseline:
+            print >> sys.stderr, 'No baseline at ' + args.baseline
+            status = 1
+
+        if args.update_baseline:
+            with open(args.baseline, 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
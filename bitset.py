@@ -0,0 +1,38 @@
+#! /usr/bin/env python
+
+# File: bitset
+# Helper functions for domains represented as integer bitmasks.
+# Authors:  Georgi Terziev      g.d.terziev@gmail.com
+#           Kasper Bouwens      kas_bouwens@hotmail.com
+
+def popcount(mask):
+    """Returns the number of bits set in the mask."""
+
+    return bin(mask).count('1')
+
+def is_singleton(mask):
+    """Checks if exactly one bit is set in the mask."""
+
+    return mask != 0 and mask & (mask - 1) == 0
+
+def bit_indices(mask):
+    """Returns the indices of the bits set in the mask.
+
+    The indices are returned in increasing order."""
+
+    indices = []
+    while mask:
+        lowest_bit = mask & -mask
+        indices.append(lowest_bit.bit_length() - 1)
+        mask ^= lowest_bit
+
+    return indices
+
+def dense_bit_indices(mask):
+    """Returns the indices of the bits set in the mask, like bit_indices.
+
+    Faster than bit_indices for wide masks with many bits set,
+    like the sets of constraints, slower for the small domains."""
+
+    digits = bin(mask)[:1:-1]
+    return [index for index, digit in enumerate(digits) if digit == '1']
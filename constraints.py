@@ -0,0 +1,243 @@
+#! /usr/bin/env python
+
+# File: constraints
+# Functors filtering the domains of the variables of a constraint.
+# Authors:  Georgi Terziev      g.d.terziev@gmail.com
+#           Kasper Bouwens      kas_bouwens@hotmail.com
+
+from bitset import bit_indices
+
+class Different:
+    """An all different constraint.
+
+    Given the domains of the variables of the constraint as bitmasks
+    removes the values of the assigned variables from the domains
+    of the other variables."""
+
+    assignment_events_only = True
+    """The constraint only filters when a variable gets assigned a value."""
+
+    def __eq__(self, other):
+        return isinstance(other, Different)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def two_domains(self, domain1, domain2):
+        if domain1 & (domain1 - 1) == 0:
+            domain2 &= ~domain1
+
+        if domain2 & (domain2 - 1) == 0:
+            domain1 &= ~domain2
+
+        return [domain1, domain2]
+
+    def __call__(self, domains):
+        """Filters the domains and returns the filtered list of domains.
+
+        An empty domain in the result means that the constraint
+        can not be satisfied."""
+
+        if len(domains) < 2:
+            return domains
+
+        if len(domains) == 2:
+            return self.two_domains(domains[0], domains[1])
+
+        domains = list(domains)
+        assigned = [i for i, domain in enumerate(domains) if domain & (domain - 1) == 0]
+        while assigned:
+            i = assigned.pop()
+            value = domains[i]
+            if value == 0:
+                continue
+            for j, domain in enumerate(domains):
+                if j != i and domain & value:
+                    domain &= ~value
+                    domains[j] = domain
+                    if domain & (domain - 1) == 0:
+                        assigned.append(j)
+
+        return domains
+
+class AllDifferent(Different):
+    """A global all different constraint.
+
+    Removes every value that can not be part of an assignment of different
+    values to all the variables of the constraint (Regin's filtering).
+    A value is kept in the domain of a variable only if the edge between
+    them belongs to some maximum matching of the variable-value graph.
+    This finds hidden singles, naked pairs (and larger naked subsets)
+    and fails when there are less values than variables.
+
+    An instance keeps the matching found by its last call and repairs it
+    on the next call, so every constraint should have its own instance."""
+
+    assignment_events_only = False
+
+    def __init__(self):
+        self.matching = []
+
+    def __call__(self, domains):
+        domains = Different.__call__(self, domains)
+        nvariables = len(domains)
+        if nvariables < 2 or 0 in domains:
+            return domains
+
+        variable_values = [bit_indices(domain) for domain in domains]
+        matching = self.find_matching(domains, variable_values)
+        if matching is None:
+            domains = list(domains)
+            domains[0] = 0
+            return domains
+
+        #Nodes of the graph: variables are 0..nvariables-1,
+        #value with bit index v is nvariables + v.
+        #Matching edges go from the variable to the value,
+        #the other edges go from the value to the variable.
+        union = 0
+        for domain in domains:
+            union |= domain
+        value_nodes = bit_indices(union)
+        nnodes = nvariables + value_nodes[-1] + 1
+        successors = [[] for node in range(nnodes)]
+        matched_values = set()
+        for variable, values in enumerate(variable_values):
+            matched_value = matching[variable]
+            matched_values.add(matched_value)
+            successors[variable].append(nvariables + matched_value)
+            for value in values:
+                if value != matched_value:
+                    successors[nvariables + value].append(variable)
+
+        #Edges on an alternating path starting at a free value are in some maximum matching.
+        reached = [False] * nnodes
+        stack = [nvariables + value for value in value_nodes if value not in matched_values]
+        for node in stack:
+            reached[node] = True
+        while stack:
+            node = stack.pop()
+            for successor in successors[node]:
+                if not reached[successor]:
+                    reached[successor] = True
+                    stack.append(successor)
+
+        #Edges inside a strongly connected component are on an alternating cycle.
+        components = self.strongly_connected_components(successors, nnodes)
+
+        filtered = list(domains)
+        for variable, values in enumerate(variable_values):
+            for value in values:
+                value_node = nvariables + value
+                if value == matching[variable] or reached[value_node]:
+                    continue
+                if components[value_node] != components[variable]:
+                    filtered[variable] &= ~(1 << value)
+
+        return filtered
+
+    def find_matching(self, domains, variable_values):
+        """Finds a matching covering all the variables.
+
+        Starts from the matching of the previous call, keeping its edges
+        that are still in the domains, and augments it for the other variables.
+        Returns a list mapping variables to the bit indices of their values,
+        or None if there is no such matching."""
+
+        nvariables = len(domains)
+        matching = [-1] * nvariables
+        value_owner = dict()
+        if len(self.matching) == nvariables:
+            for variable, value in enumerate(self.matching):
+                if value >= 0 and domains[variable] >> value & 1 and value not in value_owner:
+                    matching[variable] = value
+                    value_owner[value] = variable
+
+        for variable in range(nvariables):
+            if matching[variable] < 0 and not self.augment(variable, variable_values, matching, value_owner):
+                return None
+
+        self.matching = matching
+        return matching
+
+    def augment(self, root, variable_values, matching, value_owner):
+        """Looks for an augmenting path from the unmatched variable root.
+
+        Changes the matching along the path and returns True if found."""
+
+        visited = set()
+        #every entry is a variable and the iterator over its remaining values
+        stack = [(root, iter(variable_values[root]))]
+        parents = dict()
+        while stack:
+            variable, values = stack[-1]
+            for value in values:
+                if value in visited:
+                    continue
+                visited.add(value)
+                owner = value_owner.get(value)
+                if owner is None:
+                    #flip the edges along the path
+                    while True:
+                        previous_value = matching[variable]
+                        matching[variable] = value
+                        value_owner[value] = variable
+                        if variable == root:
+                            return True
+                        variable, value = parents[variable], previous_value
+                parents[owner] = variable
+                stack.append((owner, iter(variable_values[owner])))
+                break
+            else:
+                stack.pop()
+
+        return False
+
+    def strongly_connected_components(self, successors, nnodes):
+        """Returns a list mapping the nodes to their component numbers.
+
+        An iterative version of Tarjan's algorithm."""
+
+        index = [-1] * nnodes
+        lowlink = [0] * nnodes
+        on_stack = [False] * nnodes
+        components = [-1] * nnodes
+        component_stack = []
+        counter = 0
+        ncomponents = 0
+        for start in range(nnodes):
+            if index[start] >= 0:
+                continue
+            index[start] = lowlink[start] = counter
+            counter += 1
+            component_stack.append(start)
+            on_stack[start] = True
+            work = [(start, iter(successors[start]))]
+            while work:
+                node, children = work[-1]
+                for child in children:
+                    if index[child] < 0:
+                        index[child] = lowlink[child] = counter
+                        counter += 1
+                        component_stack.append(child)
+                        on_stack[child] = True
+                        work.append((child, iter(successors[child])))
+                        break
+                    elif on_stack[child] and index[child] < lowlink[node]:
+                        lowlink[node] = index[child]
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        if lowlink[node] < lowlink[parent]:
+                            lowlink[parent] = lowlink[node]
+                    if lowlink[node] == index[node]:
+                        while True:
+                            member = component_stack.pop()
+                            on_stack[member] = False
+                            components[member] = ncomponents
+                            if member == node:
+                                break
+                        ncomponents += 1
+
+        return components
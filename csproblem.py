@@ -7,7 +7,19 @@
 
 import copy
 import sys
+import itertools
 import constraints as cs
+from collections import deque
+from bitset import popcount, bit_indices, dense_bit_indices
+
+GENERAL_PROPAGATION = 0
+"""One pass of arc consistency over all the constraints."""
+
+OPTIMIZED_PROPAGATION = 1
+"""Passes over the constraints ordered by their smallest domain, deleting satisfied ones."""
+
+QUEUE_PROPAGATION = 2
+"""AC-3 style propagation revisiting only the constraints of changed variables."""
 
 class CSProblem:
     """A CSP problem.
@@ -20,79 +32,367 @@ class CSProblem:
     the constraints."""
 
     variable_domains = dict()
-    """A mapping from variables to their domains of possible values."""
+    """A mapping from variables to their domains of possible values.
+
+    A DomainView over domain_masks, the sets are created on access."""
+
+    domain_masks = []
+    """A mapping from variables to their domains as bitmasks.
+
+    Bit i of the mask is set if values[i] is in the domain."""
 
     variable_domain_sizes = []
     """A mapping from variables to domain sizes"""
 
-    constraints = []
-    """The constraints describing the CSP problem."""
+    size_buckets = []
+    """A mapping from domain sizes to the sets of variables with domains of that size.
+
+    Kept up to date with variable_domain_sizes, used by get_mrv_vars."""
+
+    values = []
+    """All the values appearing in the domains, in the order of their bits."""
+
+    value_bits = dict()
+    """A mapping from values to their bits in the domain masks."""
+
+    template = None
+    """The ConstraintTemplate the constraints were set from, shared between copies."""
+
+    all_constraints = []
+    """All the constraints of the problem, shared between copies.
+
+    The list is never changed, so the positions in it are used as constraint ids."""
+
+    active_constraints = 0
+    """The ids of the constraints that are not deleted, as a bitmask.
+
+    Bit i is set if constraint i is active. Deleting a constraint makes
+    a new integer, so copies and trail markers share the old one."""
+
+    variable_constraints = []
+    """A mapping from variables to the ids of the constraints they appear in."""
+
+    constraint_masks = []
+    """A mapping from variables to the ids of their constraints, as bitmasks."""
+
+    all_binary = True
+    """Whether all the constraints are over two variables."""
+
+    neighbors = []
+    """A mapping from variables to the variables sharing a constraint with them."""
+
+    groups = []
+    """The lists of variables that must all have different values, shared between copies.
+
+    Every Different constraint of the problem is implied by a group,
+    unless its id is in ungrouped_constraints. Used by dlx.ExactCover."""
+
+    ungrouped_constraints = []
+    """The ids of the constraints not implied by any of the groups."""
+
+    weights = None
+    """The ConstraintWeights used by the dom/wdeg heuristic, None if off.
+
+    The weights are learned over the whole search, so they are shared
+    by copies and not restored on backtracking."""
+
+    changed_variables = None
+    """The variables whose domains changed since the last propagation.
+
+    None if all the constraints have to be propagated."""
+
+    reasons = None
+    """A mapping from variables to the decision levels their domains depend on, None if off.
+
+    Every reason is a bitmask with bit i set if the decision made at
+    level i of the search led to a reduction of the domain."""
+
+    conflict = 0
+    """The decision levels that led to the last failed propagation, as a bitmask.
+
+    Only kept up to date when reasons are on."""
+
+    reason_trail = None
+    """The undo log of reason changes, (variable, reason) pairs."""
+
+    new_assignments = None
+    """The variables assigned a value since the last check of the nogoods, None if not tracked."""
+
+    random = None
+    """The random.Random breaking the ties of the variable and value ordering, None for fixed ties.
+
+    Shared by copies. Used by restarting searches, see restarts.RestartingSearch."""
+
+    statistics = None
+    """The stats.SolverStatistics counting the propagation work, None if not counted.
+
+    Shared by copies, like the weights."""
+
+    trail = None
+    """The undo log of domain changes, None if trailing is off.
+
+    Every entry is a (variable, domain mask, domain size) triple
+    holding the domain of the variable before the change."""
 
     diff = cs.Different()
 
     def set_variables(self, variable_domains):
-        self.variable_domains = copy.deepcopy(variable_domains)
+        all_values = set()
+        for domain in variable_domains.itervalues():
+            all_values.update(domain)
+        self.values = sorted(all_values)
+        self.value_bits = dict()
+        for i, value in enumerate(self.values):
+            self.value_bits[value] = 1 << i
+
+        self.domain_masks = list(range(len(variable_domains)))
         self.variable_domain_sizes = list(range(len(variable_domains)))
-        for variable, domain in self.variable_domains.iteritems():
+        for variable, domain in variable_domains.iteritems():
+            self.domain_masks[variable] = self.set_to_mask(domain)
             self.variable_domain_sizes[variable] = len(domain)
+        self.variable_domains = DomainView(self)
+        self.build_size_buckets()
 
-    def set_constraints(self, constraints):
-        self.constraints = copy.deepcopy(constraints)
-        self.only_different = True
-        different = cs.Different()
-        for constraint in self.constraints:
-            if not constraint[0] == different:
-                self.only_different = False
+    def set_to_mask(self, domain):
+        """Returns the bitmask of a set of values."""
 
+        mask = 0
+        for value in domain:
+            mask |= self.value_bits[value]
+
+        return mask
+
+    def mask_to_list(self, mask):
+        """Returns the values in the bitmask ordered by their bits."""
+
+        values = self.values
+        return [values[i] for i in bit_indices(mask)]
+
+    def set_domain(self, variable, mask):
+        """Restricts the domain of the variable to the bitmask."""
+
+        old_size = self.variable_domain_sizes[variable]
+        if self.trail is not None:
+            self.trail.append((variable, self.domain_masks[variable], old_size))
+        size = popcount(mask)
+        self.domain_masks[variable] = mask
+        self.variable_domain_sizes[variable] = size
+        if size != old_size:
+            self.size_buckets[old_size].discard(variable)
+            self.size_buckets[size].add(variable)
+            if size == 1 and self.new_assignments is not None:
+                self.new_assignments.append(variable)
+
+    def set_domain_masks(self, values, domain_masks):
+        """Sets the variables from ready bitmasks.
+
+        A faster set_variables for translators that know the values
+        in advance. Bit i of a mask stands for values[i]."""
+
+        self.values = values
+        self.value_bits = dict()
+        for i, value in enumerate(values):
+            self.value_bits[value] = 1 << i
+
+        self.domain_masks = domain_masks
+        self.variable_domain_sizes = map(popcount, domain_masks)
+        self.variable_domains = DomainView(self)
+        self.build_size_buckets()
+
+    def build_size_buckets(self):
+        self.size_buckets = [set() for size in range(len(self.values) + 1)]
+        for variable, domain_size in enumerate(self.variable_domain_sizes):
+            self.size_buckets[domain_size].add(variable)
+
+    def set_constraints(self, constraints):
+        self.set_constraint_template(ConstraintTemplate(copy.deepcopy(constraints), len(self.domain_masks)))
+
+    def set_constraint_template(self, template):
+        """Sets the constraints of the problem from a template.
+
+        The template is shared with the problem, not copied."""
+
+        self.template = template
+        self.all_constraints = template.constraints
+        self.active_constraints = (1 << len(template.constraints)) - 1
+        self.variable_constraints = template.variable_constraints
+        self.constraint_masks = template.constraint_masks
+        self.all_binary = template.all_binary
+        self.neighbors = template.neighbors
+        self.groups = template.groups
+        self.ungrouped_constraints = template.ungrouped_constraints
+        self.only_different = template.only_different
+        self.weights = None
+        self.changed_variables = None
 
     def add_constraints(self, constraints):
-        self.constraints.extend(copy.deepcopy(constraints))
+        constraints = copy.deepcopy(constraints)
+        nconstraints = len(self.all_constraints)
+        active_constraints = self.active_constraints
+        template = ConstraintTemplate(self.all_constraints + constraints, len(self.domain_masks), self.groups)
+        self.set_constraint_template(template)
+        #the new constraints get the ids after the old ones
+        self.active_constraints = active_constraints | (self.active_constraints >> nconstraints << nconstraints)
+
+    def constraint_count(self, variable):
+        """Returns the number of the active constraints of a variable."""
+
+        return popcount(self.active_constraints & self.constraint_masks[variable])
 
     def constraint_propagation(self, optimized):
-        """Performs constraint propagation on the CSP problem"""
+        """Performs constraint propagation on the CSP problem
+
+        optimized is one of GENERAL_PROPAGATION (or False),
+        OPTIMIZED_PROPAGATION (or True) and QUEUE_PROPAGATION."""
+
+        if optimized == QUEUE_PROPAGATION:
+            return self.queue_constraint_propagation()
 
+        self.changed_variables = []
         if optimized and self.only_different:
             return self.optimized_constraint_propagation()
 
         return self.general_constraint_propagation()
+
+    def queue_constraint_propagation(self):
+        """Propagates the constraints using a queue of constraints to revisit.
+
+        Only the constraints of the variables changed since the last
+        propagation are queued. Whenever a constraint shrinks a domain,
+        the other constraints of that variable are queued again.
+        Constraints that only react to assigned variables are not
+        queued for domains that still have several values."""
+
+        all_constraints = self.all_constraints
+        variable_constraints = self.variable_constraints
+        domain_masks = self.domain_masks
+        domain_sizes = self.variable_domain_sizes
+
+        if self.changed_variables is None:
+            queue = deque(range(len(all_constraints)))
+            queued = set(queue)
+        else:
+            queue = deque()
+            queued = set()
+            for variable in self.changed_variables:
+                for constraint_id in variable_constraints[variable]:
+                    if constraint_id not in queued:
+                        queued.add(constraint_id)
+                        queue.append(constraint_id)
+        self.changed_variables = []
+        revisions = 0
+        reductions = 0
+
+        reasons = self.reasons
+        consistent = True
+        while queue:
+            revisions += 1
+            constraint_id = queue.popleft()
+            queued.discard(constraint_id)
+            constraint_type, variables = all_constraints[constraint_id]
+            domains = constraint_type([domain_masks[var] for var in variables])
+            reason = None
+            for i, domain in enumerate(domains):
+                variable = variables[i]
+                if domain == domain_masks[variable]:
+                    continue
+                if reasons is not None and reason is None:
+                    reason = self.constraint_reason(variables)
+                if domain == 0:
+                    if reasons is not None:
+                        self.conflict = reason
+                    if self.weights is not None:
+                        self.weights.bump(constraint_id)
+                    consistent = False
+                    break
+                reductions += 1
+                self.set_domain(variable, domain)
+                if reasons is not None:
+                    self.add_reason(variable, reason)
+                assigned = domain_sizes[variable] == 1
+                for other_id in variable_constraints[variable]:
+                    if other_id in queued or other_id == constraint_id:
+                        continue
+                    if assigned or not all_constraints[other_id][0].assignment_events_only:
+                        queued.add(other_id)
+                        queue.append(other_id)
+            if not consistent:
+                break
+
+        statistics = self.statistics
+        if statistics is not None:
+            statistics.propagation_passes += 1
+            statistics.revisions += revisions
+            statistics.domain_reductions += reductions
+
+        return consistent
     
     def general_constraint_propagation(self):
-        for constraint in self.constraints:
-            if not self.arc_consistency(constraint[0], constraint[1])[0]:
-                return False
+        all_constraints = self.all_constraints
+        constraint_ids = dense_bit_indices(self.active_constraints)
+
+        while True:
+            total_domain_size = sum(self.variable_domain_sizes)
+            if self.statistics is not None:
+                self.statistics.propagation_passes += 1
+
+            for constraint_id in constraint_ids:
+                constraint_type, variables = all_constraints[constraint_id]
+                if not self.arc_consistency(constraint_type, variables)[0]:
+                    if self.weights is not None:
+                        self.weights.bump(constraint_id)
+                    return False
 
-        return True
+            #like in the optimized propagation, a pass over n-ary constraints
+            #can leave earlier constraints unpropagated
+            if self.all_binary or sum(self.variable_domain_sizes) == total_domain_size:
+                return True
+
+    def ordered_constraints(self):
+        """Returns the active constraints ordered by the smallest domain of their variables.
+
+        Returns (smallest domain size, constraint id) pairs, the ties are ordered by id."""
 
-    def constraint_key(self, constraint):
-        return min(map(lambda var: self.variable_domain_sizes[var], constraint[1]))
+        domain_size = self.variable_domain_sizes.__getitem__
+        all_constraints = self.all_constraints
+        return sorted([(min(map(domain_size, all_constraints[constraint_id][1])), constraint_id)
+                       for constraint_id in dense_bit_indices(self.active_constraints)])
 
     def optimized_constraint_propagation(self):
-        #order constriants by their variables' domain sizes
-        self.constraints.sort(key=self.constraint_key)
-        
-        all_binary = max(map(lambda constraint: len(constraint[1]), self.constraints)) == 2
+        all_constraints = self.all_constraints
+        statistics = self.statistics
+
+        #order constraints by their variables' domain sizes
+        ordered = self.ordered_constraints()
 
         #do constraint propagation
-        while self.constraints and self.constraint_key(self.constraints[0]) == 1:
-            i = 0
-            constraints_count = len(self.constraints)
-            while i < constraints_count: 
-                constraint_type, variables = self.constraints[i]
+        while ordered and ordered[0][0] == 1:
+            total_domain_size = sum(self.variable_domain_sizes)
+            if statistics is not None:
+                statistics.propagation_passes += 1
+            deleted = 0
+            for key, constraint_id in ordered:
+                constraint_type, variables = all_constraints[constraint_id]
                 consistent, stop, delete = self.arc_consistency(constraint_type, variables)
                 if not consistent:
+                    if self.weights is not None:
+                        self.weights.bump(constraint_id)
+                    self.active_constraints &= ~deleted
                     return False
                 if delete:
-                    self.constraints.pop(i)
-                    constraints_count -= 1
-                    i -= 1
+                    deleted |= 1 << constraint_id
+                    if statistics is not None:
+                        statistics.constraints_deleted += 1
                 if stop:
                     break
-                i += 1
+            self.active_constraints &= ~deleted
 
-            if not all_binary:
+            #a pass over n-ary constraints can leave earlier constraints unpropagated,
+            #so repeat it until the domains stop changing
+            if not self.all_binary and sum(self.variable_domain_sizes) == total_domain_size:
                 break
 
-            self.constraints.sort(key=self.constraint_key)
+            ordered = self.ordered_constraints()
 
         return True
 
@@ -102,7 +402,7 @@ class CSProblem:
         Removes from the domains the values that do not have support in the other domain."""
 
         domain_sizes = map(lambda var: self.variable_domain_sizes[var], variables)
-        if not 1 in domain_sizes:
+        if constraint_type.assignment_events_only and not 1 in domain_sizes:
             return True, True, False
 
         delete_constraint = True
@@ -115,15 +415,28 @@ class CSProblem:
                     break
                 has_domain_with_several_values = True
 
-        domains = map(lambda var: self.variable_domains[var], variables)
+        domain_masks = self.domain_masks
+        reason = 0
+        if self.reasons is not None:
+            reason = self.constraint_reason(variables)
+        domains = map(lambda var: domain_masks[var], variables)
         domains = constraint_type(domains)
+        statistics = self.statistics
+        if statistics is not None:
+            statistics.revisions += 1
         for i, domain in enumerate(domains):
-            self.variable_domain_sizes[variables[i]] = len(domain)
-            self.variable_domains[variables[i]] = domain
+            if domain != domain_masks[variables[i]]:
+                if statistics is not None:
+                    statistics.domain_reductions += 1
+                self.set_domain(variables[i], domain)
+                if self.reasons is not None:
+                    self.add_reason(variables[i], reason)
 
         domain_sizes = map(lambda var: self.variable_domain_sizes[var], variables)
         consistent = not 0 in domain_sizes
-        
+        if not consistent:
+            self.conflict = reason
+
         return consistent, False, delete_constraint
                 
     def is_solved(self):
@@ -142,7 +455,7 @@ class CSProblem:
 
         Returns the variables with their "assigned values" (i.e. the domains of size 1)"""
 
-        return self.variable_domains
+        return self.variable_domains.copy()
 
     def display_state(self):
         """Prints a current state of the CSP."""
@@ -160,50 +473,47 @@ class CSProblem:
         Given a variable return the set of its allowed values."""
 
         if sort_values == 0:
-            return self.variable_domains[variable]
+            values = self.mask_to_list(self.domain_masks[variable])
+            if self.random is not None:
+                self.random.shuffle(values)
+            return values
         elif sort_values == 1:
             return self.sort_values_by_tightness(variable)
         else:
             return self.sort_values_by_related_domain_sizes(variable)
 
     def sort_values_by_tightness(self, variable):
-        values = list(self.variable_domains[variable])
-        related_variables = set()
-        for constraint in self.constraints:
-            variables = constraint[1]
-            if variable in variables:
-                for var in variables:
-                    if variable != var:
-                        related_variables.add(var)
+        values = self.mask_to_list(self.domain_masks[variable])
+        related_variables = self.neighbors[variable]
 
         values_tightness = []
         for value in values:
             tightness = 0
+            bit = self.value_bits[value]
             for var in related_variables:
-                if value in self.variable_domains[var]:
+                if self.domain_masks[var] & bit:
                     tightness += 1
             values_tightness.append((tightness, value))
 
-        values_tightness.sort(reverse=True)#default = smallest tightness first
+        if self.random is not None:
+            #the ties in random order
+            self.random.shuffle(values_tightness)
+            values_tightness.sort(key=lambda entry: entry[0], reverse=True)
+        else:
+            values_tightness.sort(reverse=True)#default = smallest tightness first
         return zip(*values_tightness)[1]
 
     def sort_values_by_related_domain_sizes(self, variable):
-        values = list(self.variable_domains[variable])
-        related_variables = set()
-        for constraint in self.constraints:
-            variables = constraint[1]
-            if variable in variables:
-                for var in variables:
-                    if variable != var:
-                        related_variables.add(var)
+        values = self.mask_to_list(self.domain_masks[variable])
+        related_variables = self.neighbors[variable]
 
         related_domain_sizes = []
         for value in values:
             smallest_domain_size = sys.maxint
+            bit = self.value_bits[value]
             for var in related_variables:
-                domain = self.variable_domains[var]
-                if value in domain:
-                    domain_size = len(domain)
+                if self.domain_masks[var] & bit:
+                    domain_size = self.variable_domain_sizes[var]
                     if domain_size == 1:
                         smallest_domain_size = sys.maxint
                         break
@@ -211,10 +521,57 @@ class CSProblem:
                         smallest_domain_size = domain_size
             related_domain_sizes.append((smallest_domain_size, value))
 
-        related_domain_sizes.sort()#default = smallest tightness first
+        if self.random is not None:
+            #the ties in random order
+            self.random.shuffle(related_domain_sizes)
+            related_domain_sizes.sort(key=lambda entry: entry[0])
+        else:
+            related_domain_sizes.sort()#default = smallest tightness first
         return zip(*related_domain_sizes)[1]
 
-    def get_variable_for_splitting(self, use_mrv, use_mcv):
+    def enable_weights(self):
+        """Starts weighting the constraints by the wipe-outs they cause.
+
+        Used by the dom/wdeg heuristic, see get_wdeg_var."""
+
+        self.weights = ConstraintWeights(self.all_constraints, self.variable_constraints)
+
+    def get_wdeg_var(self):
+        """A dom/wdeg Heuristic function.
+
+        Returns the unassigned variable with the smallest ratio of its domain
+        size to the sum of the weights of its constraints. The variables are
+        visited by increasing domain size, and the visit stops as soon as
+        no larger domain can beat the best ratio found.
+        The weights count every constraint of the variable, also
+        the ones whose other variables are all assigned. A variable without
+        constraints has an infinite ratio, it is chosen last."""
+
+        variable_weights = self.weights.variable_weights
+        max_weight = float(self.weights.max_variable_weight)
+        best_variable = None
+        best_ratio = None
+        for domain_size, bucket in enumerate(self.size_buckets):
+            if domain_size < 2 or not bucket:
+                continue
+            if best_ratio is not None and domain_size / max_weight >= best_ratio:
+                break
+            for variable in bucket:
+                weight = variable_weights[variable]
+                ratio = float(domain_size) / weight if weight else float('inf')
+                if best_ratio is None or ratio < best_ratio or (ratio == best_ratio and variable < best_variable):
+                    best_variable = variable
+                    best_ratio = ratio
+
+        if best_variable is None:
+            return 0
+
+        return best_variable
+
+    def get_variable_for_splitting(self, use_mrv, use_mcv, use_wdeg=False):
+        if use_wdeg:
+            return self.get_wdeg_var()
+
         variables = {}
         if use_mrv:
             variables = self.get_mrv_vars()
@@ -226,6 +583,8 @@ class CSProblem:
             return self.get_mcv_vars(variables)	
 
         if len(variables) > 0:
+            if self.random is not None:
+                return self.random.choice(sorted(variables))
             return variables.pop()
 
         for variable, domain_size in enumerate(self.variable_domain_sizes):
@@ -237,27 +596,17 @@ class CSProblem:
     def get_mrv_vars(self):
         """A Minimum Remaining Values Heuristic function.
 
-        Returns the variable that has still not been assigned a value,
-        and has the least amount of possible values."""
+        Returns the variables that have still not been assigned a value,
+        and have the least amount of possible values. The caller breaks
+        the ties, at random if random is set."""
 
-        #variables is a list of variables
-        best_variables = set()
-        smallest_domain_size = sys.maxint
+        #the smallest bucket above 1, the number of possible domain sizes is small
+        for bucket in itertools.islice(self.size_buckets, 2, None):
+            if bucket:
+                #a new set built in increasing order, like the one the callers used to get
+                return set(sorted(bucket))
 
-        for var, domain_size in enumerate(self.variable_domain_sizes):
-            if domain_size <= 1:
-                continue
-    
-            if domain_size > smallest_domain_size:
-                continue
-    
-            if domain_size < smallest_domain_size:
-                best_variables.clear()
-                smallest_domain_size = domain_size
-    
-            best_variables.add(var)
-
-        return best_variables
+        return set()
 
     def get_mcv_vars(self, variables):
         if not variables:
@@ -265,12 +614,11 @@ class CSProblem:
 
         nconstraints = dict()
         for var in variables:
-            nconstraints[var] = 0
+            nconstraints[var] = self.constraint_count(var)
 
-        for constraint in self.constraints:
-            for var in constraint[1]:
-                if var in variables:
-                    nconstraints[var] += 1
+        if self.random is not None:
+            most = max(nconstraints.itervalues())
+            return self.random.choice(sorted(var for var, count in nconstraints.iteritems() if count == most))
 
         return max(nconstraints.iteritems(), key=lambda k_v_pair: k_v_pair[1])[0]
 
@@ -295,21 +643,291 @@ class CSProblem:
         Restrict the domain of the variable 'variable' to be
         the set with one element 'value'."""
 
-        self.variable_domains[variable] = {value}
+        old_size = self.variable_domain_sizes[variable]
+        if self.trail is not None:
+            self.trail.append((variable, self.domain_masks[variable], old_size))
+        self.domain_masks[variable] = self.value_bits[value]
         self.variable_domain_sizes[variable] = 1
-        
+        if old_size != 1:
+            self.size_buckets[old_size].discard(variable)
+            self.size_buckets[1].add(variable)
+        if self.new_assignments is not None:
+            self.new_assignments.append(variable)
+        if self.changed_variables is not None:
+            self.changed_variables.append(variable)
+
+    def enable_reasons(self):
+        """Starts recording which decisions led to the domain reductions.
+
+        Used by conflict-directed backjumping, see search.Search."""
+
+        self.reasons = [0] * len(self.domain_masks)
+        if self.trail is not None:
+            self.reason_trail = []
+
+    def constraint_reason(self, variables):
+        """Returns the union of the reasons of the variables of a constraint.
+
+        A reduction made by the constraint depends on all of these decisions."""
+
+        reasons = self.reasons
+        reason = 0
+        for variable in variables:
+            reason |= reasons[variable]
+
+        return reason
+
+    def add_reason(self, variable, reason):
+        """Adds the decision levels in reason to the reason of the variable."""
+
+        old_reason = self.reasons[variable]
+        if old_reason | reason != old_reason:
+            if self.reason_trail is not None:
+                self.reason_trail.append((variable, old_reason))
+            self.reasons[variable] = old_reason | reason
+
+    def track_assignments(self):
+        """Starts collecting the newly assigned variables in new_assignments.
+
+        The variables that are already assigned count as new."""
+
+        self.new_assignments = sorted(self.size_buckets[1])
+
+    def enable_trail(self):
+        """Starts recording the domain changes on the trail.
+
+        With the trail on the problem can be restored to a marker
+        instead of being copied before every split."""
+
+        self.trail = []
+        if self.reasons is not None:
+            self.reason_trail = []
+
+    def mark(self):
+        """Returns a marker for the current state of the problem.
+
+        Requires the trail to be on."""
+
+        changed_variables = self.changed_variables
+        if changed_variables is not None:
+            changed_variables = list(changed_variables)
+
+        reason_trail_length = 0
+        if self.reason_trail is not None:
+            reason_trail_length = len(self.reason_trail)
+
+        new_assignments = self.new_assignments
+        if new_assignments is not None:
+            new_assignments = list(new_assignments)
+
+        return (len(self.trail), self.active_constraints, changed_variables,
+                reason_trail_length, new_assignments)
+
+    def undo(self, marker):
+        """Restores the state of the problem at the time of the marker.
+
+        Undoes the domain and reason changes recorded on the trail after the marker
+        and restores the constraints that were active then."""
+
+        (trail_length, active_constraints, changed_variables,
+         reason_trail_length, new_assignments) = marker
+        trail = self.trail
+        domain_masks = self.domain_masks
+        domain_sizes = self.variable_domain_sizes
+        size_buckets = self.size_buckets
+        while len(trail) > trail_length:
+            variable, mask, size = trail.pop()
+            domain_masks[variable] = mask
+            old_size = domain_sizes[variable]
+            if size != old_size:
+                domain_sizes[variable] = size
+                size_buckets[old_size].discard(variable)
+                size_buckets[size].add(variable)
+        self.active_constraints = active_constraints
+        if changed_variables is not None:
+            changed_variables = list(changed_variables)
+        self.changed_variables = changed_variables
+        if new_assignments is not None:
+            new_assignments = list(new_assignments)
+        self.new_assignments = new_assignments
+        reason_trail = self.reason_trail
+        if reason_trail is not None:
+            reasons = self.reasons
+            while len(reason_trail) > reason_trail_length:
+                variable, reason = reason_trail.pop()
+                reasons[variable] = reason
+
     def copy(self):
         """Copies the CSP problem.
 
-        Returns a deep copy of the puzzle.
-        Changing the copy will not affect the original."""
+        Returns a copy of the puzzle.
+        Changing the copy will not affect the original.
+        The constraints are never modified, so they are shared,
+        and so is the bitmask of the active ones."""
 
         csp_copy = CSProblem()
 
-        csp_copy.variable_domains = copy.deepcopy(self.variable_domains)
-        csp_copy.variable_domain_sizes = copy.deepcopy(self.variable_domain_sizes)
-        csp_copy.constraints = copy.deepcopy(self.constraints)
+        csp_copy.values = self.values
+        csp_copy.value_bits = self.value_bits
+        csp_copy.domain_masks = list(self.domain_masks)
+        csp_copy.variable_domain_sizes = list(self.variable_domain_sizes)
+        csp_copy.size_buckets = [set(bucket) for bucket in self.size_buckets]
+        csp_copy.variable_domains = DomainView(csp_copy)
+        csp_copy.template = self.template
+        csp_copy.all_constraints = self.all_constraints
+        csp_copy.active_constraints = self.active_constraints
+        csp_copy.variable_constraints = self.variable_constraints
+        csp_copy.constraint_masks = self.constraint_masks
+        csp_copy.all_binary = self.all_binary
+        csp_copy.neighbors = self.neighbors
+        csp_copy.groups = self.groups
+        csp_copy.ungrouped_constraints = self.ungrouped_constraints
+        csp_copy.weights = self.weights
+        csp_copy.statistics = self.statistics
+        csp_copy.random = self.random
+        if self.changed_variables is not None:
+            csp_copy.changed_variables = list(self.changed_variables)
         csp_copy.only_different = self.only_different
+        if self.reasons is not None:
+            csp_copy.reasons = list(self.reasons)
+        if self.new_assignments is not None:
+            csp_copy.new_assignments = list(self.new_assignments)
 
         return csp_copy
 
+
+
+class ConstraintTemplate:
+    """The constraints of a CSP problem, ready to be shared by many problems.
+
+    Holds the list of constraints, the mapping from variables to the ids
+    (positions in the list) of their constraints, as lists and as bitmasks,
+    the mapping from variables to their neighbors in the constraint graph,
+    whether all of the constraints are binary and whether all of them
+    are Different constraints.
+    If they are, the groups are lists of variables that must all have
+    different values: the given groups (like the rows, columns and boxes
+    of a sudoku split into binary constraints) and the variables of the
+    constraints over more than two variables. ungrouped_constraints are
+    the ids of the constraints whose variables are not all in one group.
+    A template must not be changed once it is created."""
+
+    def __init__(self, constraints, nvariables, groups=None):
+        self.constraints = constraints
+        self.only_different = True
+        different = cs.Different()
+        for constraint in constraints:
+            if not constraint[0] == different:
+                self.only_different = False
+
+        self.all_binary = True
+        self.variable_constraints = [[] for variable in range(nvariables)]
+        self.constraint_masks = [0] * nvariables
+        neighbors = [set() for variable in range(nvariables)]
+        for constraint_id, constraint in enumerate(constraints):
+            if len(constraint[1]) != 2:
+                self.all_binary = False
+            for variable in constraint[1]:
+                self.variable_constraints[variable].append(constraint_id)
+                self.constraint_masks[variable] |= 1 << constraint_id
+                neighbors[variable].update(constraint[1])
+
+        for variable in range(nvariables):
+            neighbors[variable].discard(variable)
+        self.neighbors = map(sorted, neighbors)
+        self.find_groups(groups)
+
+    def find_groups(self, groups):
+        """Sets the groups and the ungrouped constraints, see the class."""
+
+        self.groups = []
+        self.ungrouped_constraints = []
+        if not self.only_different:
+            return
+
+        if groups is not None:
+            self.groups.extend(map(list, groups))
+        known = set(tuple(sorted(group)) for group in self.groups)
+        for constraint_type, variables in self.constraints:
+            if len(variables) > 2 and tuple(sorted(variables)) not in known:
+                known.add(tuple(sorted(variables)))
+                self.groups.append(list(variables))
+
+        variable_groups = [set() for variable in self.variable_constraints]
+        for group_id, group in enumerate(self.groups):
+            for variable in group:
+                variable_groups[variable].add(group_id)
+        for constraint_id, (constraint_type, variables) in enumerate(self.constraints):
+            if not set.intersection(*[variable_groups[variable] for variable in variables]):
+                self.ungrouped_constraints.append(constraint_id)
+
+    def __setstate__(self, state):
+        if 'constraint_masks' not in state:
+            #stored by an older version, index the constraints again
+            self.__init__(state['constraints'], len(state['variable_constraints']), state.get('groups'))
+            return
+
+        self.__dict__.update(state)
+
+class ConstraintWeights:
+    """The weights of the constraints of a CSP problem.
+
+    A weight is 1 plus the number of wipe-outs caused by the constraint.
+    The weight of a variable is the sum of the weights of its constraints,
+    it is updated whenever one of them is bumped."""
+
+    def __init__(self, constraints, variable_constraints):
+        self.constraints = constraints
+        self.constraint_weights = [1] * len(constraints)
+        self.variable_weights = map(len, variable_constraints)
+        self.max_variable_weight = max(self.variable_weights + [1])
+
+    def bump(self, constraint_id):
+        """Bumps the weight of a constraint that caused a wipe-out."""
+
+        self.constraint_weights[constraint_id] += 1
+        variable_weights = self.variable_weights
+        for variable in self.constraints[constraint_id][1]:
+            variable_weights[variable] += 1
+            if variable_weights[variable] > self.max_variable_weight:
+                self.max_variable_weight = variable_weights[variable]
+
+class DomainView:
+    """A dict-of-sets view of the domains of a CSP problem.
+
+    Reading the domain of a variable returns a new set built from
+    its bitmask, so changing that set does not affect the problem.
+    Assigning a set to a variable replaces the domain of the variable."""
+
+    def __init__(self, problem):
+        self.problem = problem
+
+    def __getitem__(self, variable):
+        return set(self.problem.mask_to_list(self.problem.domain_masks[variable]))
+
+    def __setitem__(self, variable, domain):
+        self.problem.set_domain(variable, self.problem.set_to_mask(domain))
+
+    def __len__(self):
+        return len(self.problem.domain_masks)
+
+    def __iter__(self):
+        return iter(range(len(self.problem.domain_masks)))
+
+    def __contains__(self, variable):
+        return 0 <= variable < len(self.problem.domain_masks)
+
+    def keys(self):
+        return range(len(self.problem.domain_masks))
+
+    def iteritems(self):
+        for variable in range(len(self.problem.domain_masks)):
+            yield variable, self[variable]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def copy(self):
+        """Returns the domains as a dict of sets."""
+
+        return dict(self.iteritems())
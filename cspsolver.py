@@ -5,98 +5,557 @@
 # Authors:  Georgi Terziev      g.d.terziev@gmail.com
 #           Kasper Bouwens      kas_bouwens@hotmail.com
 
+import os
 import sys
+import argparse
+import itertools
+import multiprocessing
+from collections import deque
 from sudoku import Sudoku
-from csproblem import CSProblem
-import time
+from search import Search, SOLVED
+from restarts import RestartingSearch, UNKNOWN
+from parallel import ParallelSearch
+from dlx import ExactCover, fits_exact_cover
+from portfolio import Portfolio, PortfolioSearch, load_portfolio
+from batchpropagation import solve_sudokus_vectorized
+from stats import SolverStatistics
+from solutioncache import SolutionCache
+from streaming import LineReader, ReadAhead, SolutionWriter, Checkpoint, open_input, open_output, STANDARD_STREAM
 
-splits = 0
-"""A global variable used by the solve_CSP function,
-and the constraint_satisfaction function to count the number of splits
-done while solving the CSP problem."""
+worker_translator = None
+"""The sudoku translator of a worker process of the batch mode."""
 
-total_splits = 0
+worker_timing = False
+"""Whether a worker process measures the time of the search phases."""
 
+worker_limits = None
+"""The keyword arguments of solve_CSP_within_limits used by a worker process, None for no limits."""
 
-def solve_sudoku(sudoku_translator, sudoku_string):
+worker_count_limit = None
+"""The number of solutions a worker process counts up to, None to solve the sudokus."""
+
+worker_exact_cover = None
+"""Whether a worker process solves the sudokus as exact cover problems, see resolve_exact_cover."""
+
+worker_portfolio = None
+"""The portfolio.Portfolio a worker process races on every sudoku, None for a single search."""
+
+def resolve_exact_cover(exact_cover, limits=None):
+    """Returns whether a sudoku is searched as an exact cover problem.
+
+    exact_cover is True or False if it was chosen. None picks the exact
+    cover search (see create_search) unless limits (see solve_sudoku) have
+    a node limit or a restart schedule. A node of dlx.ExactCover is every
+    item it chooses, also the forced ones, so a node limit would mean far
+    less search than with search.Search; and it has no random ties for the
+    restarts. A time limit alone means the same for both."""
+
+    if exact_cover is not None:
+        return exact_cover
+
+    return limits is None or (limits.get('node_limit') is None and limits.get('schedule') is None)
+
+def solve_sudoku(sudoku_translator, sudoku_string, statistics=None, cache=None, limits=None, exact_cover=None,
+                 portfolio=None):
     """Solves a given sudoku puzzle.
 
     Given a sudoku puzzle it will try to solve it using costraint satisfaction.
     If it succeeds it will return the solution.
-    Otherwise returns 'No solution'."""
-    
-    global splits
-    splits = 0
+    Otherwise returns 'No solution'.
+    The search is counted in statistics, if given.
+    With a solutioncache.SolutionCache the solution is looked up there first,
+    and stored there after solving.
+    With limits (keyword arguments of solve_CSP_within_limits) the search
+    may be given up, then 'Unknown.' is returned and nothing is cached.
+    With a portfolio (a running portfolio.Portfolio) its configurations
+    race on the sudoku, see solve_CSP_portfolio, within the node_limit
+    and time_limit of limits.
+    Otherwise exact_cover, resolved by resolve_exact_cover, is passed on to
+    solve_CSP or solve_CSP_within_limits."""
+
+    if cache is not None:
+        form, transformation, found, solution_string = cache.lookup(sudoku_string)
+        if found:
+            if solution_string is None:
+                return False, 'No solution.'
+            return True, solution_string
     
     csp = sudoku_translator.translate_sudoku_to_CSP(sudoku_string)
+    exact_cover = resolve_exact_cover(exact_cover, limits)
     
-    (has_solution, solution) = solve_CSP(csp)
+    if portfolio is not None or limits is not None:
+        if portfolio is not None:
+            status, solution = solve_CSP_portfolio(csp, statistics=statistics, portfolio=portfolio, **(limits or dict()))
+        else:
+            status, solution = solve_CSP_within_limits(csp, statistics=statistics, exact_cover=exact_cover, **limits)
+        if status == UNKNOWN:
+            return False, 'Unknown.'
+        has_solution = status == SOLVED
+    else:
+        (has_solution, solution) = solve_CSP(csp, exact_cover, statistics=statistics)
+
+    solution_string = None
+    if has_solution:
+        solution_string = sudoku_translator.translate_solution(solution)
+    if cache is not None:
+        cache.store(form, transformation, solution_string)
     
     if not has_solution:
         return False, 'No solution.'
     else:
-        return True, sudoku_translator.translate_solution(solution)
+        return True, solution_string
         
-def solve_CSP(problem):
+def create_search(problem, exact_cover=True, **options):
+    """Returns the search for the solutions of a CSP problem.
+
+    That is a dlx.ExactCover if exact_cover is set, the problem fits an
+    exact cover (see dlx.fits_exact_cover) and there are no options but
+    statistics, otherwise a search.Search with the options."""
+
+    if exact_cover and set(options) <= {'statistics'} and fits_exact_cover(problem):
+        return ExactCover(problem, **options)
+
+    return Search(problem, **options)
+
+def solve_CSP(problem, exact_cover=True, **options):
     """Solves a CSP problem using a constraint satisfaction algorithm.
 
     Given a CSP problem it solves it using a constraint satisfaction
     algorithm. Uses Minimum Remaining Values heuristic to choose
-    the variable for splitting. Performs constraint propagation."""
+    the variable for splitting. Performs constraint propagation.
+    The search is done iteratively by search.Search, see there for the options.
+    Problems of Different constraints, like sudokus, are solved as exact
+    cover problems by dlx.ExactCover instead, see create_search.
+    Pass a stats.SolverStatistics as the statistics option to get the counters
+    of the search."""
 
-    global splits
+    search = create_search(problem, exact_cover, **options)
+    status = search.run()
 
-    if not problem.constraint_propagation(True):#optimized?
+    if status != SOLVED:
         return False, 'No solution.'
-    
-    if problem.is_solved():
-        return True, problem.get_solution()
-
-    variable = problem.get_variable_for_splitting(True, False)#MRV?, MCV?
-    domain = problem.get_variable_domain(variable, 1)#SVH: 0 == None, 1 == by tightness, otherwise domain sizes
-
-    for value in domain:
-        new_problem = problem.copy()
-        splits += 1
-        new_problem.set_variable(variable, value)
-        (has_solution, solution) = solve_CSP(new_problem)
-        if has_solution:
-            return has_solution, solution
-    
-    return False, 'No solution.'
 
+    return True, search.solution
+
+def iterate_CSP_solutions(problem, limit=None, exact_cover=True, **options):
+    """Yields the solutions of a CSP problem, at most limit of them (None for all).
+
+    The solutions are searched for one at a time, as they are taken,
+    see search.Search.solutions. The options are those of solve_CSP."""
+
+    return create_search(problem, exact_cover, **options).solutions(limit)
+
+def count_CSP_solutions(problem, limit=None, exact_cover=True, **options):
+    """Counts the solutions of a CSP problem, stopping at limit (None for no limit)."""
+
+    return sum(1 for solution in iterate_CSP_solutions(problem, limit, exact_cover, **options))
+
+def has_unique_solution(problem, exact_cover=True, **options):
+    """Checks that a CSP problem has exactly one solution.
+
+    The search stops at the second solution."""
+
+    return count_CSP_solutions(problem, 2, exact_cover, **options) == 1
+
+def count_sudoku_solutions(sudoku_translator, sudoku_string, limit=None, statistics=None, exact_cover=True):
+    """Counts the solutions of a sudoku, stopping at limit (None for no limit)."""
+
+    csp = sudoku_translator.translate_sudoku_to_CSP(sudoku_string)
+    return count_CSP_solutions(csp, limit, exact_cover, statistics=statistics)
+
+def solve_CSP_within_limits(problem, node_limit=None, time_limit=None, schedule=None, scale=100, seed=None, **options):
+    """Solves a CSP problem, giving up after node_limit nodes or time_limit seconds.
+
+    schedule is None, 'luby' or 'geometric', the restart schedule of
+    restarts.RestartingSearch with a first cutoff of scale nodes, which
+    breaks the ties at random (from seed) after the first restart.
+    The other options are passed on to restarts.RestartingSearch (see there
+    for exact_cover) and search.Search, the statistics option is counted
+    over all the restarts.
+    Returns the status, SOLVED, UNSATISFIABLE or UNKNOWN, and the solution."""
+
+    search = RestartingSearch(problem, node_limit, time_limit, schedule, scale, seed=seed, **options)
+    status = search.run()
+
+    return status, search.solution
+
+def solve_CSP_parallel(problem, workers, split_depth=2, statistics=None, **options):
+    """Solves a CSP problem searching its tree with several processes.
+
+    Returns the same as solve_CSP. The first split_depth levels of the tree
+    are split by this process, see parallel.ParallelSearch for the rest.
+    The statistics of all the processes are added to statistics, if given."""
+
+    search = ParallelSearch(problem, workers, split_depth, **options)
+    status = search.run()
+    if statistics is not None:
+        statistics.merge(search.statistics)
+
+    if status != SOLVED:
+        return False, 'No solution.'
+
+    return True, search.solution
+
+def solve_CSP_portfolio(problem, configurations=None, node_limit=None, time_limit=None, statistics=None, portfolio=None):
+    """Solves a CSP problem racing several configurations in separate processes.
+
+    configurations are keyword arguments of restarts.RestartingSearch,
+    portfolio.DEFAULT_PORTFOLIO if None. The first configuration to answer
+    wins and the others give up, see portfolio.PortfolioSearch.
+    To solve many problems pass a running portfolio.Portfolio as portfolio,
+    its configurations are used and it keeps its processes between the
+    problems, otherwise processes are started for this problem only.
+    The statistics of the winner are added to statistics, if given.
+    Returns the status, SOLVED, UNSATISFIABLE or UNKNOWN, and the solution."""
+
+    search = PortfolioSearch(problem, configurations, node_limit, time_limit, portfolio)
+    status = search.run()
+    if statistics is not None:
+        statistics.merge(search.statistics)
+
+    return status, search.solution
+
+def initialize_worker(global_constraints, timing=False, limits=None, count_limit=None, exact_cover=None, portfolio=None):
+    """Creates the sudoku translator of a worker process."""
+
+    global worker_translator, worker_timing, worker_limits, worker_count_limit, worker_exact_cover, worker_portfolio
+    worker_translator = Sudoku(global_constraints)
+    worker_timing = timing
+    worker_limits = limits
+    worker_count_limit = count_limit
+    worker_exact_cover = exact_cover
+    worker_portfolio = portfolio
+
+def solve_sudoku_in_worker(line):
+    """Solves a line of the input in a worker process.
+
+    Returns the solution string and the stats.SolverStatistics of the solve,
+    which the parent process adds to its total."""
+
+    statistics = SolverStatistics(worker_timing)
+    if worker_count_limit is not None:
+        count = count_sudoku_solutions(worker_translator, line.rstrip('\n'), worker_count_limit, statistics,
+                                       resolve_exact_cover(worker_exact_cover))
+        return str(count), statistics
+
+    solved, solution_string = solve_sudoku(worker_translator, line.rstrip('\n'), statistics, limits=worker_limits,
+                                           exact_cover=worker_exact_cover, portfolio=worker_portfolio)
+    return solution_string, statistics
+
+def solve_chunk_in_worker(lines):
+    """Solves a chunk of lines in a worker process with the vectorized propagation."""
+
+    return solve_sudokus_vectorized(worker_translator, [line.rstrip('\n') for line in lines], worker_timing, worker_limits,
+                                    resolve_exact_cover(worker_exact_cover, worker_limits))
+
+def chunks(lines, chunksize):
+    """Yields lists of chunksize consecutive lines."""
+
+    lines = iter(lines)
+    while True:
+        chunk = list(itertools.islice(lines, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+def solve_sudokus(lines, global_constraints, workers, chunksize, vectorized=False, timing=False, limits=None,
+                  count_limit=None, exact_cover=None, portfolio=None):
+    """Solves the sudokus on the lines.
+
+    Yields the solution string and the stats.SolverStatistics of every sudoku,
+    in the order of the lines. With more than one worker the lines are sent
+    to a pool of processes in chunks of chunksize lines.
+    With vectorized every chunk is first propagated at once by
+    batchpropagation.solve_sudokus_vectorized.
+    limits are the limits of every sudoku, see solve_sudoku.
+    With a count_limit the solutions of every sudoku are counted instead,
+    up to count_limit, and the count is yielded for the solution string.
+    exact_cover and portfolio are passed on to solve_sudoku, a portfolio
+    needs a single worker: its processes belong to this process.
+    The pool reads a few chunks per worker ahead of the results, not more."""
+
+    if workers == 1:
+        initialize_worker(global_constraints, timing, limits, count_limit, exact_cover, portfolio)
+        if vectorized:
+            for chunk in chunks(lines, chunksize):
+                for result in solve_chunk_in_worker(chunk):
+                    yield result
+            return
+        for line in lines:
+            yield solve_sudoku_in_worker(line)
+        return
+
+    pool = multiprocessing.Pool(workers, initialize_worker, (global_constraints, timing, limits, count_limit,
+                                                                 exact_cover))
+    lines = ReadAhead(lines, workers * chunksize * 4)
+    try:
+        if vectorized:
+            for chunk_results in pool.imap(solve_chunk_in_worker, chunks(lines, chunksize)):
+                for result in chunk_results:
+                    lines.done()
+                    yield result
+        else:
+            for result in pool.imap(solve_sudoku_in_worker, lines, chunksize):
+                lines.done()
+                yield result
+        pool.close()
+    finally:
+        lines.close()
+        pool.terminate()
+        pool.join()
+
+def solve_sudokus_cached(lines, cache, global_constraints, workers, chunksize, vectorized=False, timing=False, limits=None,
+                         exact_cover=None, portfolio=None):
+    """Solves the sudokus on the lines, looking them up in a solutioncache.SolutionCache first.
+
+    Yields the same as solve_sudokus, the statistics of the sudokus found
+    in the cache are all zero. Only the sudokus not found are solved,
+    by solve_sudokus, and their solutions are cached. A sudoku equivalent
+    to one that is being solved waits for its solution. The sudokus given up
+    within the limits are not cached."""
+
+    #every line in order as [line, canonical form, transformation, state], appended as the lines are read
+    entries = deque()
+    #the canonical forms of the sudokus being solved
+    solving = set()
+
+    def missing_lines():
+        for line in lines:
+            line = line.rstrip('\n')
+            form, transformation, found, solution_string = cache.lookup(line)
+            if found:
+                entries.append([line, form, transformation, 'found', solution_string])
+            elif form in solving:
+                entries.append([line, form, transformation, 'waiting', None])
+            else:
+                solving.add(form)
+                entries.append([line, form, transformation, 'solving', None])
+                yield line
+
+    def cached_result(entry):
+        line, form, transformation, state, solution_string = entry
+        if state == 'waiting':
+            found, solution_string = cache.find(form, transformation, True)
+            if not found:
+                #evicted before it was needed
+                return solve_sudoku_in_worker(line)
+        if solution_string is None:
+            solution_string = 'No solution.'
+        return solution_string, SolverStatistics(timing)
+
+    initialize_worker(global_constraints, timing, limits, exact_cover=exact_cover, portfolio=portfolio)
+    for result in solve_sudokus(missing_lines(), global_constraints, workers, chunksize, vectorized, timing, limits,
+                                exact_cover=exact_cover, portfolio=portfolio):
+        while True:
+            entry = entries.popleft()
+            if entry[3] == 'solving':
+                break
+            yield cached_result(entry)
+
+        line, form, transformation, state, solution_string = entry
+        solution_string = result[0]
+        if solution_string == 'No solution.':
+            solution_string = None
+        if solution_string != 'Unknown.':
+            cache.store(form, transformation, solution_string)
+        solving.discard(form)
+        yield result
+
+    while entries:
+        yield cached_result(entries.popleft())
 
 #Different puzzles follow.
 def main(argv):
-    global total_splits
-    total_splits = 0
-    sudokus = open(argv[1], 'r')
-    solutions = open(argv[2], 'w')
-    number_of_sudokus = 0
-
-    if len(argv) > 3:
-        number_of_sudokus = int(argv[3])
-
-    nsudokus = 0
-    sudoku_translator = Sudoku()
-    for line in sudokus:
-        if number_of_sudokus != 0 and nsudokus == number_of_sudokus:
-            break
-        sudoku = line.rstrip('\n')
-        solved, solutionString = solve_sudoku(sudoku_translator, sudoku)
-        solutions.write(solutionString+ '\n')
-        solutions.flush()
-        total_splits += splits
-        nsudokus +=1
-
-    print 'Total number of splits done: ' + str(total_splits)
-    sys.stdout.flush()
+    parser = argparse.ArgumentParser(prog='cspsolver.py', description='Solves the sudokus in a file, one per line.')
+    parser.add_argument('inputfile', help="the sudokus, '-' for stdin")
+    parser.add_argument('outputfile', help="the file the solutions are written to, '-' for stdout")
+    parser.add_argument('number_of_sudokus', nargs='?', type=int, default=0,
+                        help='solve only the first number_of_sudokus lines')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='number of worker processes (default 1, 0 for one per CPU)')
+    parser.add_argument('--chunksize', type=int, default=32,
+                        help='number of sudokus sent to a worker at a time')
+    parser.add_argument('-g', '--global-constraints', action='store_true',
+                        help='use AllDifferent constraints for rows, columns and boxes')
+    parser.add_argument('--vectorized', action='store_true',
+                        help='propagate every chunk of sudokus at once with numpy before searching')
+    parser.add_argument('--stats', metavar='FILE',
+                        help='write the statistics of every sudoku to FILE, one JSON object per line')
+    parser.add_argument('--timing', action='store_true',
+                        help='measure the time spent in every phase of the search for the statistics')
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help='save the progress to FILE, and resume from it if it exists')
+    parser.add_argument('--checkpoint-every', type=int, default=1000,
+                        help='number of sudokus solved between checkpoints')
+    parser.add_argument('--write-batch', type=int, default=256,
+                        help='number of solutions written at a time')
+    parser.add_argument('--block-size', type=int, default=1 << 20,
+                        help='number of bytes read from the input at a time')
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='cache the solutions of this many sudokus, equivalent sudokus share a solution')
+    parser.add_argument('--cache-file', metavar='FILE',
+                        help='load the solution cache from FILE and save it there')
+    parser.add_argument('--node-limit', type=int,
+                        help="give up a sudoku after this many nodes, its solution is then 'Unknown.' "
+                             "A node is a decision of the constraint propagation search and its propagation; "
+                             "with --exact-cover it is every item chosen, also the forced ones")
+    parser.add_argument('--time-limit', type=float,
+                        help='give up a sudoku after this many seconds')
+    parser.add_argument('--restarts', choices=['luby', 'geometric'],
+                        help='restart the search of a sudoku with random ties on this schedule')
+    parser.add_argument('--restart-scale', type=int, default=100,
+                        help='the nodes of the first restart cutoff')
+    parser.add_argument('--seed', type=int,
+                        help='the seed of the random ties of the restarts')
+    parser.add_argument('--exact-cover', dest='exact_cover', action='store_true', default=None,
+                        help='solve the sudokus as exact cover problems also with --node-limit or --restarts '
+                             '(the default without them)')
+    parser.add_argument('--no-exact-cover', dest='exact_cover', action='store_false',
+                        help='search with constraint propagation instead of solving the sudokus as exact cover problems')
+    parser.add_argument('--count', type=int, metavar='K',
+                        help='write the number of solutions of every sudoku instead, counting up to K '
+                             '(2 checks that the solution is unique)')
+    parser.add_argument('--portfolio', nargs='?', const='', metavar='FILE',
+                        help='race several search configurations on every sudoku, each in a process of its own '
+                             'kept for all the sudokus, the ones in FILE (see benchmark.py --tune) or the default ones; '
+                             'it needs a CPU per configuration, with fewer it is slower than a single search')
+    args = parser.parse_args(argv[1:])
+
+    workers = args.workers
+    if workers == 0:
+        workers = multiprocessing.cpu_count()
+
+    #with the solutions on stdout the messages go to stderr
+    messages = sys.stdout
+    if args.outputfile == STANDARD_STREAM:
+        messages = sys.stderr
+
+    checkpoint = None
+    state = None
+    if args.checkpoint is not None:
+        if STANDARD_STREAM in (args.inputfile, args.outputfile):
+            parser.error('checkpoints need an input file and an output file')
+        checkpoint = Checkpoint(args.checkpoint)
+        state = checkpoint.load()
+        if state is not None and (state['input'] != os.path.abspath(args.inputfile) or
+                                  state['output'] != os.path.abspath(args.outputfile)):
+            parser.error('the checkpoint %s belongs to another run' % args.checkpoint)
+
+    total = SolverStatistics(args.timing)
+    solved_sudokus = 0
+    input_offset = 0
+    output_offset = None
+    statistics_offset = None
+    if state is not None:
+        solved_sudokus = state['sudokus']
+        input_offset = state['input_offset']
+        output_offset = state['output_offset']
+        statistics_offset = state['statistics_offset']
+        total.merge_dict(state['statistics'])
+        print >> messages, 'Resuming after %d sudokus' % solved_sudokus
+
+    sudokus = open_input(args.inputfile)
+    solutions = open_output(args.outputfile, output_offset)
+    statistics_file = None
+    if args.stats is not None:
+        statistics_file = open_output(args.stats, statistics_offset)
+
+    solution_writer = SolutionWriter(solutions, args.write_batch)
+    statistics_writer = None
+    if statistics_file is not None:
+        statistics_writer = SolutionWriter(statistics_file, args.write_batch)
+
+    if args.count is not None:
+        if args.count < 1:
+            parser.error('--count needs a positive number of solutions')
+        if args.vectorized or args.cache_size > 0 or args.node_limit is not None or \
+           args.time_limit is not None or args.restarts is not None:
+            parser.error('--count cannot be used with --vectorized, the cache or the limits')
+
+    if args.restart_scale < 1:
+        parser.error('--restart-scale must be at least 1')
+
+    portfolio = None
+    if args.portfolio is not None:
+        if workers != 1 or args.vectorized or args.count is not None or args.restarts is not None:
+            parser.error('--portfolio cannot be used with more than one worker, --vectorized, --count or --restarts')
+        configurations = None
+        if args.portfolio:
+            configurations = load_portfolio(args.portfolio)
+        portfolio = Portfolio(configurations)
+
+    limits = None
+    if portfolio is not None:
+        if args.node_limit is not None or args.time_limit is not None:
+            limits = {'node_limit': args.node_limit, 'time_limit': args.time_limit}
+    elif args.node_limit is not None or args.time_limit is not None or args.restarts is not None:
+        limits = {'node_limit': args.node_limit, 'time_limit': args.time_limit, 'schedule': args.restarts,
+                  'scale': args.restart_scale, 'seed': args.seed}
+
+    cache = None
+    if args.cache_size > 0:
+        cache = SolutionCache(args.cache_size, args.cache_file)
+
+    def save_checkpoint():
+        solution_writer.flush()
+        os.fsync(solutions.fileno())
+        statistics_position = None
+        if statistics_writer is not None:
+            statistics_writer.flush()
+            os.fsync(statistics_file.fileno())
+            statistics_position = statistics_file.tell()
+        checkpoint.save({'input': os.path.abspath(args.inputfile),
+                         'output': os.path.abspath(args.outputfile),
+                         'input_offset': input_offset,
+                         'output_offset': solutions.tell(),
+                         'statistics_offset': statistics_position,
+                         'sudokus': solved_sudokus,
+                         'statistics': total.as_dict()})
+
+    reader = LineReader(sudokus, input_offset, args.block_size)
+    lines = iter(reader)
+    if args.number_of_sudokus != 0:
+        lines = itertools.islice(lines, max(args.number_of_sudokus - solved_sudokus, 0))
+
+    if cache is not None:
+        results = solve_sudokus_cached(lines, cache, args.global_constraints, workers, args.chunksize,
+                                       args.vectorized, args.timing, limits, args.exact_cover, portfolio)
+    else:
+        results = solve_sudokus(lines, args.global_constraints, workers, args.chunksize, args.vectorized,
+                                args.timing, limits, args.count, args.exact_cover, portfolio)
+    for solutionString, statistics in results:
+        solved_sudokus += 1
+        input_offset = reader.offsets.popleft()
+        solution_writer.write(solutionString)
+        total.merge(statistics)
+        if statistics_writer is not None:
+            if args.count is not None:
+                record = statistics.to_json(sudoku=solved_sudokus, solutions=int(solutionString))
+            else:
+                record = statistics.to_json(sudoku=solved_sudokus,
+                                            solved=solutionString not in ('No solution.', 'Unknown.'),
+                                            unknown=solutionString == 'Unknown.')
+            statistics_writer.write(record)
+        if checkpoint is not None and solved_sudokus % args.checkpoint_every == 0:
+            save_checkpoint()
+
+    if checkpoint is not None:
+        save_checkpoint()
+    solution_writer.flush()
+    if statistics_writer is not None:
+        statistics_writer.flush()
+
+    print >> messages, 'Total number of splits done: ' + str(total.splits)
+    if cache is not None:
+        cache.save()
+        print >> messages, 'Solutions found in the cache: %d of %d' % (cache.hits, cache.hits + cache.misses)
+    messages.flush()
     sudokus.close()
     solutions.close()
+    if statistics_file is not None:
+        statistics_file.close()
+    if portfolio is not None:
+        portfolio.close()
 
 if __name__ == '__main__':
-    if len(sys.argv) < 3:
-        print('usage: python cspsolver.py inputfile.txt outputfile.txt')
-        sys.exit()
-
     main(sys.argv)
@@ -0,0 +1,270 @@
+#! /usr/bin/env python
+
+# File: dlx
+# An exact cover solver (Algorithm X with dancing links) for CSP problems of Different constraints.
+# Authors:  Georgi Terziev      g.d.terziev@gmail.com
+#           Kasper Bouwens      kas_bouwens@hotmail.com
+
+import time
+from search import SOLVED, UNSATISFIABLE, SUSPENDED
+from stats import SolverStatistics
+from bitset import bit_indices
+
+def fits_exact_cover(problem):
+    """Checks if a CSP problem is solved better as an exact cover problem.
+
+    It has to have only Different constraints and at least one group
+    (see CSProblem.groups) with as many variables as there are values,
+    which then has to take every value exactly once."""
+
+    if not problem.only_different:
+        return False
+
+    nvalues = len(problem.values)
+    for group in problem.groups:
+        if len(group) == nvalues:
+            return True
+
+    return False
+
+class ExactCover:
+    """A search for the solutions of a CSP problem of Different constraints as an exact cover.
+
+    Every variable is an item that has to be covered exactly once, by the
+    option of one of the values in its domain. Every group of the problem
+    with as many variables as there are values has an item for every value
+    that has to be covered exactly once, the other groups and the
+    constraints not implied by any group have an item for every value that
+    can be covered at most once. Knuth's Algorithm X with dancing links
+    searches the options, always on the item with the fewest options left.
+
+    Has the interface of search.Search: run, step, resume, solutions, status and
+    solution, which is a dict from the variables to the sets of their values.
+    The statistics are counted in a stats.SolverStatistics: nodes are the
+    items chosen, splits the options tried for the items with more than one,
+    failures the items with none, backtracks the options tried after the
+    first. Only the on_solution hook is called.
+    The problem is not changed."""
+
+    def __init__(self, problem, statistics=None):
+        self.problem = problem
+        if statistics is None:
+            statistics = SolverStatistics()
+        self.statistics = statistics
+        self.status = None
+        self.solution = None
+        self.solver = None
+        self.node_budget = None
+
+    def build(self):
+        """Builds the dancing links of the exact cover matrix.
+
+        The lists left, right, up, down and column link the nodes: node 0 is
+        the root, nodes 1 to the number of items are the item headers, the
+        rest are the options, one node per item of an option.
+        Only the headers of the exactly once items are linked to the root.
+        option_assignments maps the nodes to the (variable, value) of their option."""
+
+        problem = self.problem
+        nvariables = len(problem.domain_masks)
+        nvalues = len(problem.values)
+
+        #the items of the values of a group or constraint, as the item of value 0
+        primary = []
+        secondary = []
+        for group in problem.groups:
+            if len(group) == nvalues:
+                primary.append(group)
+            else:
+                secondary.append(group)
+        for constraint_id in problem.ungrouped_constraints:
+            secondary.append(problem.all_constraints[constraint_id][1])
+
+        variable_items = [[] for variable in range(nvariables)]
+        nitems = nvariables
+        for variables in primary + secondary:
+            for variable in variables:
+                variable_items[variable].append(nitems + 1)
+            nitems += nvalues
+        nprimary = nvariables + len(primary) * nvalues
+
+        left = range(-1, nitems)
+        right = range(1, nitems + 2)
+        left[0] = nprimary
+        right[nprimary] = 0
+        for item in range(nprimary + 1, nitems + 1):
+            left[item] = right[item] = item
+        up = range(nitems + 1)
+        down = range(nitems + 1)
+        column = range(nitems + 1)
+        sizes = [0] * (nitems + 1)
+        option_assignments = [None] * (nitems + 1)
+
+        for variable, domain in enumerate(problem.domain_masks):
+            for bit in bit_indices(domain):
+                items = [variable + 1] + [item + bit for item in variable_items[variable]]
+                first = len(column)
+                for position, item in enumerate(items):
+                    node = first + position
+                    left.append(node - 1 if position else first + len(items) - 1)
+                    right.append(node + 1 if position < len(items) - 1 else first)
+                    up.append(up[item])
+                    down.append(item)
+                    down[up[item]] = node
+                    up[item] = node
+                    column.append(item)
+                    sizes[item] += 1
+                    option_assignments.append((variable, problem.values[bit]))
+
+        return left, right, up, down, column, sizes, option_assignments
+
+    def search(self):
+        """Yields the solutions one at a time, see the class.
+
+        Yields None when the node budget of step ran out."""
+
+        left, right, up, down, column, sizes, option_assignments = self.build()
+        statistics = self.statistics
+
+        def cover(item):
+            right[left[item]] = right[item]
+            left[right[item]] = left[item]
+            option = down[item]
+            while option != item:
+                node = right[option]
+                while node != option:
+                    up[down[node]] = up[node]
+                    down[up[node]] = down[node]
+                    sizes[column[node]] -= 1
+                    node = right[node]
+                option = down[option]
+
+        def uncover(item):
+            option = up[item]
+            while option != item:
+                node = left[option]
+                while node != option:
+                    sizes[column[node]] += 1
+                    up[down[node]] = node
+                    down[up[node]] = node
+                    node = left[node]
+                option = up[option]
+            right[left[item]] = item
+            left[right[item]] = item
+
+        def select(option):
+            node = right[option]
+            while node != option:
+                cover(column[node])
+                node = right[node]
+
+        def deselect(option):
+            node = left[option]
+            while node != option:
+                uncover(column[node])
+                node = left[node]
+
+        #the options chosen, one for every level
+        chosen = []
+        while True:
+            if right[0] == 0:
+                solution = dict()
+                for option in chosen:
+                    variable, value = option_assignments[option]
+                    solution[variable] = {value}
+                yield solution
+            else:
+                while self.node_budget is not None and self.node_budget <= 0:
+                    yield None
+                if self.node_budget is not None:
+                    self.node_budget -= 1
+                statistics.nodes += 1
+                item = right[0]
+                best = item
+                fewest = sizes[item]
+                while item != 0 and fewest > 1:
+                    if sizes[item] < fewest:
+                        best = item
+                        fewest = sizes[item]
+                    item = right[item]
+
+                if fewest > 0:
+                    if fewest > 1:
+                        statistics.splits += 1
+                    cover(best)
+                    option = down[best]
+                    select(option)
+                    chosen.append(option)
+                    continue
+                statistics.failures += 1
+
+            #backtrack to the last level with an option left
+            while chosen:
+                option = chosen.pop()
+                deselect(option)
+                item = column[option]
+                option = down[option]
+                if option != item:
+                    statistics.splits += 1
+                    statistics.backtracks += 1
+                    select(option)
+                    chosen.append(option)
+                    break
+                uncover(item)
+            else:
+                return
+
+    def run(self):
+        """Searches until a solution is found or the search space is exhausted."""
+
+        return self.step(None)
+
+    def step(self, node_budget):
+        """Continues the search for at most node_budget nodes, like search.Search.step."""
+
+        if self.status is not None:
+            return self.status
+
+        statistics = self.statistics
+        self.node_budget = node_budget
+        start = time.time()
+        try:
+            if self.solver is None:
+                self.solver = self.search()
+            solution = next(self.solver, False)
+        finally:
+            statistics.time += time.time() - start
+
+        if solution is None:
+            return SUSPENDED
+        if solution is False:
+            self.status = UNSATISFIABLE
+            return UNSATISFIABLE
+
+        self.solution = solution
+        self.status = SOLVED
+        if statistics.on_solution is not None:
+            statistics.on_solution(self, self.solution)
+        return SOLVED
+
+    def resume(self):
+        """Makes the search go on to the next solution after a solution was found."""
+
+        if self.status != SOLVED:
+            return
+
+        self.status = None
+        self.solution = None
+
+    def solutions(self, limit=None):
+        """Yields the solutions of the problem one at a time, at most limit of them.
+
+        The same as search.Search.solutions."""
+
+        count = 0
+        while limit is None or count < limit:
+            self.resume()
+            if self.run() != SOLVED:
+                return
+            count += 1
+            yield self.solution
@@ -0,0 +1,172 @@
+#! /usr/bin/env python
+
+# File: nogoods
+# A bounded store of nogoods learned from the failures of the search.
+# Authors:  Georgi Terziev      g.d.terziev@gmail.com
+#           Kasper Bouwens      kas_bouwens@hotmail.com
+
+from collections import OrderedDict
+
+LRU = 'lru'
+"""Evict the nogoods that were used (added or matched) least recently."""
+
+ACTIVITY = 'activity'
+"""Evict the nogoods that pruned or failed the least nodes."""
+
+class NogoodStore:
+    """A store of nogoods.
+
+    A nogood is a set of (variable, value) assignments that can not all
+    hold in a solution. The search adds one whenever all the values of a
+    split failed: the assignments made by the splits in the conflict of the
+    failure form a nogood. The store is then checked against the newly
+    assigned variables of every node (see propagate).
+
+    The memory used is bounded by capacity, the maximum number of
+    assignments stored over all the nogoods. When it is exceeded nogoods
+    are evicted according to the eviction policy, LRU or ACTIVITY.
+    A store can be shared by several searches started from the same root,
+    like the runs of a restarts.RestartingSearch. The assignments made
+    before a search started are not part of its nogoods, so they do not
+    hold for searches started from other assignments."""
+
+    def __init__(self, capacity=100000, eviction=LRU):
+        if eviction not in (LRU, ACTIVITY):
+            raise Exception('NogoodStore', 'Unknown eviction policy: ' + str(eviction))
+
+        self.capacity = capacity
+        self.eviction = eviction
+        #a mapping from nogoods (frozensets of assignments) to their activities,
+        #in the order of their last use
+        self.nogoods = OrderedDict()
+        #a mapping from assignments to the nogoods they appear in
+        self.watches = dict()
+        self.literals = 0
+        self.added = 0
+        self.evicted = 0
+        self.conflicts = 0
+        self.prunings = 0
+
+    def __len__(self):
+        return len(self.nogoods)
+
+    def add(self, assignments):
+        """Adds a nogood, given as a list of (variable, value) pairs."""
+
+        nogood = frozenset(assignments)
+        if not nogood or len(nogood) > self.capacity or nogood in self.nogoods:
+            return
+
+        self.nogoods[nogood] = 0
+        for assignment in nogood:
+            self.watches.setdefault(assignment, set()).add(nogood)
+        self.literals += len(nogood)
+        self.added += 1
+
+        if self.literals > self.capacity:
+            self.evict()
+
+    def remove(self, nogood):
+        del self.nogoods[nogood]
+        for assignment in nogood:
+            watching = self.watches[assignment]
+            watching.discard(nogood)
+            if not watching:
+                del self.watches[assignment]
+        self.literals -= len(nogood)
+        self.evicted += 1
+
+    def evict(self):
+        """Evicts nogoods until the store fits its capacity."""
+
+        if self.eviction == LRU:
+            while self.literals > self.capacity:
+                self.remove(next(iter(self.nogoods)))
+            return
+
+        #evict down to 90% of the capacity, so that eviction does not happen on every add,
+        #the least active first and among those the oldest first
+        by_activity = sorted(enumerate(self.nogoods.iteritems()), key=lambda entry: (entry[1][1], entry[0]))
+        for age, (nogood, activity) in by_activity:
+            if self.literals <= 0.9 * self.capacity:
+                break
+            self.remove(nogood)
+
+        #age the activities of the survivors
+        for nogood in self.nogoods:
+            self.nogoods[nogood] /= 2
+
+    def touch(self, nogood):
+        """Records that a nogood was used."""
+
+        activity = self.nogoods.pop(nogood)
+        self.nogoods[nogood] = activity + 1
+
+    def propagate(self, problem):
+        """Checks the nogoods against the variables newly assigned in the problem.
+
+        If all but one assignment of a nogood hold, removes the value of the
+        remaining one from its domain. Returns False if all the assignments
+        of a nogood hold, then problem.conflict holds the reasons of the failure.
+        Requires problem.track_assignments() and problem.enable_reasons()."""
+
+        domain_masks = problem.domain_masks
+        value_bits = problem.value_bits
+        values = problem.values
+        reasons = problem.reasons
+        pending = problem.new_assignments
+        problem.new_assignments = []
+        while pending:
+            variable = pending.pop()
+            mask = domain_masks[variable]
+            if mask == 0 or mask & (mask - 1):
+                continue
+            value = values[mask.bit_length() - 1]
+            watching = self.watches.get((variable, value))
+            if not watching:
+                continue
+
+            for nogood in list(watching):
+                open_assignment = None
+                reason = 0
+                for assignment in nogood:
+                    other_variable, other_value = assignment
+                    bit = value_bits[other_value]
+                    other_mask = domain_masks[other_variable]
+                    if other_mask == bit:
+                        reason |= reasons[other_variable]
+                    elif other_mask & bit and open_assignment is None:
+                        open_assignment = assignment
+                    else:
+                        #the assignment can not hold or a second one is still open
+                        break
+                else:
+                    self.touch(nogood)
+                    if open_assignment is None:
+                        self.conflicts += 1
+                        problem.conflict = reason
+                        return False
+
+                    other_variable, other_value = open_assignment
+                    problem.set_domain(other_variable, domain_masks[other_variable] & ~value_bits[other_value])
+                    if problem.statistics is not None:
+                        problem.statistics.domain_reductions += 1
+                    problem.add_reason(other_variable, reason)
+                    if problem.changed_variables is not None:
+                        problem.changed_variables.append(other_variable)
+                    self.prunings += 1
+
+            pending.extend(problem.new_assignments)
+            problem.new_assignments = []
+
+        return True
+
+    def statistics(self):
+        """Returns a dict with the size of the store and its counters."""
+
+        return {'nogoods': len(self.nogoods),
+                'literals': self.literals,
+                'added': self.added,
+                'evicted': self.evicted,
+                'conflicts': self.conflicts,
+                'prunings': self.prunings}
@@ -0,0 +1,164 @@
+#! /usr/bin/env python
+
+# File: parallel
+# Searching the tree of a single CSP problem with several processes.
+# Authors:  Georgi Terziev      g.d.terziev@gmail.com
+#           Kasper Bouwens      kas_bouwens@hotmail.com
+
+import multiprocessing
+import Queue
+from search import Search, SOLVED, UNSATISFIABLE, SUSPENDED
+from nogoods import NogoodStore
+from stats import SolverStatistics
+
+def search_worker(problem, options, node_budget, tasks, results, created, idle, stop):
+    """The main loop of a worker process.
+
+    Takes tasks (lists of (variable, value) decisions) from the tasks queue,
+    searches the subtree of the problem below those decisions and puts
+    the outcome on the results queue. Every node_budget nodes it checks
+    if the search was cancelled, and if other workers are idle and there
+    is no work left in the queue it gives away the untried values of its
+    topmost split as new tasks.
+    A task learns its nogoods in a new store like the one of the options:
+    the decisions of the task are not part of them, so they only hold
+    below those decisions."""
+
+    while not stop.is_set():
+        try:
+            decisions = tasks.get(True, 0.1)
+        except Queue.Empty:
+            continue
+
+        with idle.get_lock():
+            idle.value -= 1
+
+        node = problem.copy()
+        for variable, value in decisions:
+            node.set_variable(variable, value)
+
+        task_options = options
+        if options.get('nogoods') is not None:
+            store = options['nogoods']
+            task_options = dict(options, nogoods=NogoodStore(store.capacity, store.eviction))
+        search = Search(node, **task_options)
+        while search.step(node_budget) == SUSPENDED:
+            if stop.is_set():
+                break
+            if idle.value > 0 and tasks.empty():
+                subtrees = search.split_off()
+                with created.get_lock():
+                    created.value += len(subtrees)
+                for subtree in subtrees:
+                    tasks.put(decisions + subtree)
+
+        if search.status == SOLVED:
+            stop.set()
+
+        with idle.get_lock():
+            idle.value += 1
+        results.put((search.status, search.solution, search.statistics))
+
+class ParallelSearch:
+    """A search for a solution of a CSP problem by several processes.
+
+    The parent process splits the problem split_depth levels deep and puts
+    the subtrees in a queue shared by the workers. A worker that runs out of
+    work is fed by the busy ones, which give away the untried values of their
+    topmost splits. When a worker finds a solution the others are stopped.
+
+    options are passed on to search.Search. The statistics of the
+    workers are added to the statistics of the parallel search."""
+
+    def __init__(self, problem, workers, split_depth=2, node_budget=100, **options):
+        self.problem = problem
+        self.workers = workers
+        self.split_depth = split_depth
+        self.node_budget = node_budget
+        self.options = options
+        self.status = None
+        self.solution = None
+        self.statistics = SolverStatistics()
+
+    def initial_tasks(self):
+        """Splits the problem split_depth levels deep.
+
+        Returns the decisions leading to every subtree of that level.
+        If a solution is found on the way it is stored and None is returned."""
+
+        #a search that is never run, holding the options with their defaults
+        settings = Search(self.problem.copy(), **self.options)
+        if settings.use_wdeg and self.problem.weights is None:
+            #the nodes are copies of the problem, they share its weights
+            self.problem.enable_weights()
+        tasks = [[]]
+        for level in range(self.split_depth):
+            next_tasks = []
+            for decisions in tasks:
+                node = self.problem.copy()
+                node.statistics = self.statistics
+                for variable, value in decisions:
+                    node.set_variable(variable, value)
+                self.statistics.nodes += 1
+                if not node.constraint_propagation(settings.optimized):
+                    continue
+                if node.is_solved():
+                    self.solution = node.get_solution()
+                    return None
+                variable = node.get_variable_for_splitting(settings.use_mrv, settings.use_mcv, settings.use_wdeg)
+                for value in node.get_variable_domain(variable, settings.sort_values):
+                    self.statistics.splits += 1
+                    next_tasks.append(decisions + [(variable, value)])
+            tasks = next_tasks
+
+        return tasks
+
+    def run(self):
+        """Searches until a solution is found or the search space is exhausted.
+
+        Returns SOLVED or UNSATISFIABLE."""
+
+        tasks = self.initial_tasks()
+        if tasks is None:
+            self.status = SOLVED
+            return SOLVED
+
+        task_queue = multiprocessing.Queue()
+        results = multiprocessing.Queue()
+        created = multiprocessing.Value('i', len(tasks))
+        idle = multiprocessing.Value('i', self.workers)
+        stop = multiprocessing.Event()
+        for decisions in tasks:
+            task_queue.put(decisions)
+
+        processes = []
+        for worker in range(self.workers):
+            process = multiprocessing.Process(target=search_worker,
+                                              args=(self.problem, self.options, self.node_budget,
+                                                    task_queue, results, created, idle, stop))
+            process.daemon = True
+            process.start()
+            processes.append(process)
+
+        self.status = UNSATISFIABLE
+        finished = 0
+        try:
+            while finished < created.value:
+                try:
+                    status, solution, statistics = results.get(True, 0.1)
+                except Queue.Empty:
+                    continue
+                finished += 1
+                self.statistics.merge(statistics)
+                if status == SOLVED:
+                    self.status = SOLVED
+                    self.solution = solution
+                    break
+        finally:
+            stop.set()
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+
+        return self.status
@@ -0,0 +1,226 @@
+#! /usr/bin/env python
+
+# File: portfolio
+# Racing several search configurations on a CSP problem in separate processes.
+# Authors:  Georgi Terziev      g.d.terziev@gmail.com
+#           Kasper Bouwens      kas_bouwens@hotmail.com
+
+import json
+import signal
+import multiprocessing
+import Queue
+from search import SOLVED, UNSATISFIABLE
+from restarts import RestartingSearch, UNKNOWN, LUBY
+from csproblem import CSProblem, OPTIMIZED_PROPAGATION, QUEUE_PROPAGATION
+from stats import SolverStatistics
+
+DEFAULT_PORTFOLIO = [{'exact_cover': True},
+                     {'optimized': QUEUE_PROPAGATION, 'use_wdeg': True},
+                     {'optimized': OPTIMIZED_PROPAGATION, 'sort_values': 0},
+                     {'optimized': QUEUE_PROPAGATION, 'schedule': LUBY, 'seed': 1}]
+"""The configurations raced when none are given, keyword arguments of restarts.RestartingSearch.
+
+Four processes, so the race needs four CPUs to run at full speed, see Portfolio."""
+
+def load_portfolio(path):
+    """Reads the configurations of a portfolio from a JSON file.
+
+    The file is either a list of configurations or the output of
+    benchmark.py --tune, whose 'configurations' are taken."""
+
+    with open(path, 'r') as portfolio_file:
+        portfolio = json.load(portfolio_file)
+    if isinstance(portfolio, dict):
+        portfolio = portfolio.get('configurations')
+    if not isinstance(portfolio, list) or not portfolio or not all(isinstance(options, dict) for options in portfolio):
+        raise Exception('load_portfolio', 'Expected a non-empty list of configurations in ' + path)
+
+    #JSON has unicode keys, keyword arguments need str
+    return [dict((str(key), value) for key, value in options.iteritems()) for options in portfolio]
+
+class Answered:
+    """Tells a process of a Portfolio that its problem was answered, the stop of restarts.RestartingSearch."""
+
+    def __init__(self, answered, problem_id):
+        self.answered = answered
+        self.problem_id = problem_id
+
+    def is_set(self):
+        return self.answered.value >= self.problem_id
+
+def unpack_problem(template, state):
+    """Returns the CSProblem of a task of a Portfolio, see Portfolio.pack_problem."""
+
+    if template is None:
+        return state
+
+    values, domain_masks, active_constraints = state
+    problem = CSProblem()
+    problem.set_domain_masks(values, list(domain_masks))
+    problem.set_constraint_template(template)
+    problem.active_constraints = active_constraints
+    return problem
+
+def portfolio_worker(index, options, tasks, results, answered):
+    """The main loop of the process of a configuration of a Portfolio.
+
+    Takes the problems from the tasks queue until a None, searches every
+    one with the options and puts (problem id, index, status, solution,
+    statistics) on results. A problem answered by another configuration
+    is given up, or skipped if it was answered before it was started."""
+
+    #the parent stops the portfolio, an interrupt of the terminal is for the parent only
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    #the constraint templates by their keys, see Portfolio.pack_problem
+    templates = dict()
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+
+        problem_id, key, template, state, node_limit, time_limit = task
+        if template is not None:
+            templates[key] = template
+        if answered.value >= problem_id:
+            continue
+
+        problem = unpack_problem(templates.get(key), state)
+        search = RestartingSearch(problem, node_limit, time_limit, stop=Answered(answered, problem_id), **options)
+        status = search.run()
+        results.put((problem_id, index, status, search.solution, search.statistics))
+
+class Portfolio:
+    """Processes racing several search configurations on one CSP problem after another.
+
+    Every configuration (keyword arguments of restarts.RestartingSearch, see
+    DEFAULT_PORTFOLIO) has a process of its own, started once and kept for
+    all the problems, so a problem costs no process start. Every problem is
+    searched by all of them, the first SOLVED or UNSATISFIABLE answer wins
+    and the others give the problem up within
+    RestartingSearch.time_check_interval nodes. close stops the processes.
+
+    The configurations run at the same time and share the CPUs. With a CPU
+    for every configuration a problem takes as long as its best one, which
+    cuts the tail of problems that are hard for a single configuration.
+    With fewer CPUs the winner gets only a share of one and every problem
+    takes longer than with the best configuration alone; benchmark.py
+    --tune finds that one for a known workload."""
+
+    def __init__(self, configurations=None):
+        if configurations is None:
+            configurations = DEFAULT_PORTFOLIO
+        self.configurations = configurations
+        self.results = multiprocessing.Queue()
+        #the id of the last problem answered, the problems are numbered from 1
+        self.answered = multiprocessing.Value('l', 0)
+        self.problem_id = 0
+        #the constraint templates sent to the processes, as (key, template) by the ids of the templates
+        self.templates = dict()
+        self.task_queues = []
+        self.processes = []
+        for index, options in enumerate(configurations):
+            tasks = multiprocessing.Queue()
+            process = multiprocessing.Process(target=portfolio_worker,
+                                              args=(index, options, tasks, self.results, self.answered))
+            process.daemon = True
+            process.start()
+            self.task_queues.append(tasks)
+            self.processes.append(process)
+
+    def pack_problem(self, problem):
+        """Returns the key of the constraint template of a problem, the template and the state to send.
+
+        The template (see CSProblem.template) is sent only the first time,
+        later it is None and the processes look it up by its key. The state
+        is the values, the domains and the active constraints of the problem.
+        A problem without a template is sent as it is, as the state."""
+
+        template = problem.template
+        if template is None:
+            return None, None, problem
+
+        known = self.templates.get(id(template))
+        if known is not None:
+            key, template = known[0], None
+        else:
+            key = len(self.templates)
+            self.templates[id(template)] = (key, template)
+        return key, template, (problem.values, problem.domain_masks, problem.active_constraints)
+
+    def solve(self, problem, node_limit=None, time_limit=None):
+        """Races the configurations on a problem, within node_limit nodes and time_limit seconds each.
+
+        Returns the status (SOLVED, UNSATISFIABLE, or UNKNOWN if every
+        configuration ran out of its limits), the solution, the index of the
+        configuration that answered (None if none did) and the statistics
+        of its search."""
+
+        self.problem_id += 1
+        key, template, state = self.pack_problem(problem)
+        for tasks in self.task_queues:
+            tasks.put((self.problem_id, key, template, state, node_limit, time_limit))
+
+        answer = (UNKNOWN, None, None, SolverStatistics())
+        finished = 0
+        while finished < len(self.processes):
+            try:
+                problem_id, index, status, solution, statistics = self.results.get(True, 0.1)
+            except Queue.Empty:
+                if not all(process.is_alive() for process in self.processes):
+                    raise Exception('Portfolio', 'A portfolio process died')
+                continue
+            if problem_id != self.problem_id:
+                #given up on an earlier problem
+                continue
+            finished += 1
+            if status in (SOLVED, UNSATISFIABLE):
+                answer = (status, solution, index, statistics)
+                break
+
+        with self.answered.get_lock():
+            self.answered.value = self.problem_id
+        return answer
+
+    def close(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+
+class PortfolioSearch:
+    """A search for a solution of a CSP problem racing several configurations.
+
+    The configurations race in the processes of portfolio, a running
+    Portfolio, or of a Portfolio started for this search only, which costs
+    a process start per configuration. See Portfolio.solve for the limits.
+    The status is SOLVED, UNSATISFIABLE or UNKNOWN, winner is the index of
+    the configuration that answered, None if none did, and statistics are
+    the statistics of its search only."""
+
+    def __init__(self, problem, configurations=None, node_limit=None, time_limit=None, portfolio=None):
+        self.problem = problem
+        self.configurations = configurations
+        self.node_limit = node_limit
+        self.time_limit = time_limit
+        self.portfolio = portfolio
+        self.status = None
+        self.solution = None
+        self.winner = None
+        self.statistics = SolverStatistics()
+
+    def run(self):
+        """Races the configurations until one answers or all ran out of their limits.
+
+        Returns SOLVED, UNSATISFIABLE or UNKNOWN."""
+
+        portfolio = self.portfolio
+        if portfolio is None:
+            portfolio = Portfolio(self.configurations)
+        try:
+            self.status, self.solution, self.winner, self.statistics = portfolio.solve(self.problem, self.node_limit,
+                                                                                       self.time_limit)
+        finally:
+            if self.portfolio is None:
+                portfolio.close()
+
+        return self.status
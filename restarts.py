@@ -0,0 +1,160 @@
+#! /usr/bin/env python
+
+# File: restarts
+# A search with node and time limits, restarted with randomized ties.
+# Authors:  Georgi Terziev      g.d.terziev@gmail.com
+#           Kasper Bouwens      kas_bouwens@hotmail.com
+
+import time
+import random
+from search import Search, SUSPENDED
+from dlx import ExactCover, fits_exact_cover
+from stats import SolverStatistics
+
+UNKNOWN = 'unknown'
+"""The outcome of a search that ran out of its limits."""
+
+LUBY = 'luby'
+GEOMETRIC = 'geometric'
+
+def luby(index):
+    """Returns the index-th element (from 1) of the Luby sequence 1, 1, 2, 1, 1, 2, 4, 1, ..."""
+
+    while True:
+        length = 1
+        while (1 << length) - 1 < index:
+            length += 1
+        #the first 2^length - 1 elements are the first 2^(length-1) - 1 twice, then 2^(length-1)
+        if index == (1 << length) - 1:
+            return 1 << (length - 1)
+        index -= (1 << (length - 1)) - 1
+
+def cutoffs(schedule, scale, factor):
+    """Yields the node limits of the successive runs of a restart schedule.
+
+    LUBY gives scale times the Luby sequence,
+    GEOMETRIC scale, scale * factor, scale * factor^2, ...
+    Every cutoff is at least 1 node, a run of none would restart forever."""
+
+    if schedule == LUBY:
+        index = 1
+        while True:
+            yield max(scale * luby(index), 1)
+            index += 1
+    elif schedule == GEOMETRIC:
+        cutoff = float(scale)
+        while True:
+            yield max(int(cutoff), 1)
+            cutoff *= factor
+    else:
+        raise Exception('cutoffs', 'Unknown restart schedule: ' + str(schedule))
+
+class RestartingSearch:
+    """A search for a solution of a CSP problem within node and time limits.
+
+    Without a restart schedule it is a single search.Search given up after
+    node_limit nodes or time_limit seconds (None for no limit).
+    With a schedule (LUBY or GEOMETRIC) the search is restarted from the
+    start whenever a run used up its cutoff of nodes. The first run breaks
+    the ties of the variable and value ordering like a plain search, the
+    later ones break them at random (from seed), so they explore different
+    parts of the tree. What the runs learn is kept: the nogoods store and
+    the dom/wdeg weights are shared by all the runs.
+
+    The outcome (status) is SOLVED, UNSATISFIABLE, or UNKNOWN when the
+    limits ran out. A run that is not cut off is a complete search,
+    so its UNSATISFIABLE holds for the problem.
+
+    stop, if given, is checked like the time limit, the search is given
+    up (UNKNOWN) once its is_set() is true, like a multiprocessing.Event.
+
+    options are passed on to search.Search. With exact_cover and no
+    options, a problem that fits an exact cover is searched by
+    dlx.ExactCover instead, in a single run: it has no ties to break
+    at random, so the schedule is not used. Its nodes are all the items
+    it chooses, also the forced ones, so the same node_limit allows it
+    less search than search.Search."""
+
+    time_check_interval = 100
+    """The nodes searched between the checks of the time limit and the stop."""
+
+    def __init__(self, problem, node_limit=None, time_limit=None, schedule=None, scale=100, factor=1.5, seed=None, statistics=None,
+                 exact_cover=False, stop=None, **options):
+        if schedule is not None and scale < 1:
+            raise Exception('RestartingSearch', 'The restart scale must be at least 1, got ' + str(scale))
+        if schedule == GEOMETRIC and factor < 1:
+            raise Exception('RestartingSearch', 'The geometric restart factor must be at least 1, got ' + str(factor))
+
+        self.problem = problem
+        self.exact_cover = exact_cover and not options and fits_exact_cover(problem)
+        self.node_limit = node_limit
+        self.time_limit = time_limit
+        self.stop = stop
+        self.schedule = schedule
+        self.scale = scale
+        self.factor = factor
+        self.random = random.Random(seed)
+        self.options = options
+        if statistics is None:
+            statistics = SolverStatistics()
+        self.statistics = statistics
+        if options.get('use_wdeg') and problem.weights is None:
+            #the copies share the weights
+            problem.enable_weights()
+        self.status = None
+        self.solution = None
+
+    def run(self):
+        """Searches until a solution is found, the search space is exhausted or a limit is reached.
+
+        Returns SOLVED, UNSATISFIABLE or UNKNOWN."""
+
+        start = time.time()
+        remaining_nodes = self.node_limit
+        run_cutoffs = [None]
+        if self.schedule is not None and not self.exact_cover:
+            run_cutoffs = cutoffs(self.schedule, self.scale, self.factor)
+
+        for run, cutoff in enumerate(run_cutoffs):
+            if run > 0:
+                self.statistics.restarts += 1
+            problem = self.problem
+            if self.exact_cover:
+                search = ExactCover(problem, self.statistics)
+            else:
+                if self.schedule is not None:
+                    problem = problem.copy()
+                    if run > 0:
+                        problem.random = self.random
+                search = Search(problem, statistics=self.statistics, **self.options)
+
+            while True:
+                budget = cutoff
+                if remaining_nodes is not None:
+                    budget = remaining_nodes if budget is None else min(budget, remaining_nodes)
+                if self.time_limit is not None or self.stop is not None:
+                    budget = self.time_check_interval if budget is None else min(budget, self.time_check_interval)
+
+                nodes = self.statistics.nodes
+                status = search.step(budget)
+                used = self.statistics.nodes - nodes
+                if cutoff is not None:
+                    cutoff -= used
+                if remaining_nodes is not None:
+                    remaining_nodes -= used
+
+                if status != SUSPENDED:
+                    self.status = status
+                    self.solution = search.solution
+                    return status
+                if remaining_nodes is not None and remaining_nodes <= 0:
+                    self.status = UNKNOWN
+                    return UNKNOWN
+                if self.time_limit is not None and time.time() - start >= self.time_limit:
+                    self.status = UNKNOWN
+                    return UNKNOWN
+                if self.stop is not None and self.stop.is_set():
+                    self.status = UNKNOWN
+                    return UNKNOWN
+                if cutoff is not None and cutoff <= 0:
+                    break
@@ -0,0 +1,297 @@
+#! /usr/bin/env python
+
+# File: search
+# An iterative search engine for CSP problems.
+# Authors:  Georgi Terziev      g.d.terziev@gmail.com
+#           Kasper Bouwens      kas_bouwens@hotmail.com
+
+import time
+from csproblem import QUEUE_PROPAGATION
+from stats import SolverStatistics
+
+SOLVED = 'solved'
+UNSATISFIABLE = 'unsatisfiable'
+SUSPENDED = 'suspended'
+
+SOLUTION_CONFLICT = -1
+"""The conflict of a split with a solution below it, every decision level."""
+
+class ChoicePoint(object):
+    """A split in the search tree.
+
+    Holds the problem that was split, the variable used for the split,
+    the ordered values of the variable and the index of the next value to try.
+    In trail mode the marker restores the problem to the state before the split.
+    With backjumping the conflict collects the levels of the earlier splits
+    that the failures below this split depend on."""
+
+    __slots__ = ('problem', 'variable', 'values', 'index', 'marker', 'conflict')
+
+    def __init__(self, problem, variable, values, marker, conflict):
+        self.problem = problem
+        self.variable = variable
+        self.values = values
+        self.index = 0
+        self.marker = marker
+        self.conflict = conflict
+
+class Search:
+    """A depth-first search for a solution of a CSP problem.
+
+    Does the same search as a recursive backtracking algorithm,
+    but keeps the splits on an explicit stack of choice points.
+    The search can be suspended after a number of nodes and resumed later.
+
+    Options:
+    optimized   - the constraint propagation, see CSProblem.constraint_propagation.
+    use_mrv     - split on a variable with Minimum Remaining Values.
+    use_mcv     - break the MRV ties by the number of constraints.
+    use_wdeg    - split on the variable with the smallest domain size
+                  to weighted degree ratio (dom/wdeg), instead of MRV/MCV.
+    sort_values - 0 == None, 1 == by tightness, otherwise domain sizes.
+    use_trail   - restore the problem from its trail instead of copying it.
+    backjumping - on a failure jump back to the deepest split responsible for it.
+    nogoods     - a nogoods.NogoodStore to learn nogoods in and check them, or None.
+    statistics  - the stats.SolverStatistics to count in, a new one if None.
+
+    Conflict-directed backjumping: the split at depth i of the stack is
+    decision level i+1. The problem records which levels every domain
+    reduction depends on, and a failed propagation reports the levels
+    of the failed constraint. The search drops every split whose level
+    is not in that conflict, without trying their other values.
+
+    Nogood learning uses the same conflicts: when all the values of a split
+    failed, the assignments of the splits in its conflict form a nogood.
+
+    After a solution the search can go on to the next one, see solutions.
+    The solution counts as a failure depending on every split, so there is
+    no jump over a split with a solution below it, and no nogood is learned
+    from such a split (its assignments do not fail, they were used up)."""
+
+    def __init__(self, problem, optimized=QUEUE_PROPAGATION, use_mrv=True, use_mcv=False, sort_values=1, use_trail=True, backjumping=False, nogoods=None, use_wdeg=False, statistics=None):
+        self.optimized = optimized
+        self.use_mrv = use_mrv
+        self.use_mcv = use_mcv
+        self.use_wdeg = use_wdeg
+        self.sort_values = sort_values
+        self.use_trail = use_trail
+        self.backjumping = backjumping
+        self.nogoods = nogoods
+        #conflicts are needed for backjumping and for learning nogoods
+        self.use_conflicts = backjumping or nogoods is not None
+        if use_trail and problem.trail is None:
+            problem.enable_trail()
+        if self.use_conflicts and problem.reasons is None:
+            problem.enable_reasons()
+        if nogoods is not None and problem.new_assignments is None:
+            problem.track_assignments()
+        if use_wdeg and problem.weights is None:
+            problem.enable_weights()
+
+        if statistics is None:
+            statistics = SolverStatistics()
+        self.statistics = statistics
+        problem.statistics = statistics
+
+        self.choice_points = []
+        self.next_problem = problem
+        self.status = None
+        self.solution = None
+
+    def run(self):
+        """Searches until a solution is found or the search space is exhausted."""
+
+        return self.step(None)
+
+    def step(self, node_budget):
+        """Continues the search for at most node_budget nodes.
+
+        Returns SOLVED or UNSATISFIABLE if the search is over,
+        and SUSPENDED if the budget ran out before that.
+        A node_budget of None means no limit."""
+
+        if self.status is not None:
+            return self.status
+
+        statistics = self.statistics
+        start = time.time()
+        try:
+            return self.search(node_budget)
+        finally:
+            statistics.time += time.time() - start
+
+    def search(self, node_budget):
+        """The search loop of step, see there."""
+
+        choice_points = self.choice_points
+        statistics = self.statistics
+        timing = statistics.timing
+        phase_times = statistics.phase_times
+        while True:
+            problem = self.next_problem
+            if problem is not None:
+                if node_budget is not None:
+                    if node_budget <= 0:
+                        return SUSPENDED
+                    node_budget -= 1
+
+                self.next_problem = None
+                statistics.nodes += 1
+                if statistics.on_node is not None:
+                    statistics.on_node(self, problem)
+                if timing:
+                    start = time.time()
+                consistent = self.propagate(problem)
+                if timing:
+                    phase_times['propagation'] += time.time() - start
+
+                if consistent:
+                    if problem.is_solved():
+                        self.solution = problem.get_solution()
+                        self.status = SOLVED
+                        if statistics.on_solution is not None:
+                            statistics.on_solution(self, self.solution)
+                        return SOLVED
+
+                    if timing:
+                        start = time.time()
+                    variable = problem.get_variable_for_splitting(self.use_mrv, self.use_mcv, self.use_wdeg)
+                    values = problem.get_variable_domain(variable, self.sort_values)
+                    if timing:
+                        phase_times['selection'] += time.time() - start
+                    marker = None
+                    if self.use_trail:
+                        marker = problem.mark()
+                    conflict = 0
+                    if self.use_conflicts:
+                        #the values missing from the domain were removed for these reasons
+                        conflict = problem.reasons[variable]
+                    choice_points.append(ChoicePoint(problem, variable, values, marker, conflict))
+                else:
+                    statistics.failures += 1
+                    if statistics.on_failure is not None:
+                        statistics.on_failure(self, problem)
+                    if self.use_conflicts:
+                        self.backjump(problem.conflict)
+
+            if not choice_points:
+                self.status = UNSATISFIABLE
+                return UNSATISFIABLE
+
+            choice_point = choice_points[-1]
+            if choice_point.index == len(choice_point.values):
+                choice_points.pop()
+                if self.use_conflicts:
+                    if timing:
+                        start = time.time()
+                    if self.nogoods is not None and choice_point.conflict != SOLUTION_CONFLICT:
+                        self.learn(choice_point.conflict)
+                    self.backjump(choice_point.conflict)
+                    if timing:
+                        phase_times['learning'] += time.time() - start
+                continue
+
+            value = choice_point.values[choice_point.index]
+            if choice_point.index > 0:
+                statistics.backtracks += 1
+            choice_point.index += 1
+            if timing:
+                start = time.time()
+            if self.use_trail:
+                problem = choice_point.problem
+                problem.undo(choice_point.marker)
+            else:
+                problem = choice_point.problem.copy()
+            if timing:
+                phase_times['backtracking'] += time.time() - start
+            statistics.splits += 1
+            problem.set_variable(choice_point.variable, value)
+            if self.use_conflicts:
+                problem.add_reason(choice_point.variable, 1 << len(choice_points))
+            self.next_problem = problem
+
+    def resume(self):
+        """Makes the search go on to the next solution after a solution was found."""
+
+        if self.status != SOLVED:
+            return
+
+        self.status = None
+        self.solution = None
+        for choice_point in self.choice_points:
+            choice_point.conflict = SOLUTION_CONFLICT
+
+    def solutions(self, limit=None):
+        """Yields the solutions of the problem one at a time, at most limit of them.
+
+        The search stops when it found limit solutions (None for no limit)
+        or when there are no more, then status is UNSATISFIABLE.
+        Every solution is searched for only when the previous one was taken."""
+
+        count = 0
+        while limit is None or count < limit:
+            self.resume()
+            if self.run() != SOLVED:
+                return
+            count += 1
+            yield self.solution
+
+    def propagate(self, problem):
+        """Propagates the constraints and the nogoods until neither changes a domain.
+
+        Returns False if the problem turned out inconsistent."""
+
+        self.statistics.propagations += 1
+        consistent = problem.constraint_propagation(self.optimized)
+        while consistent and self.nogoods is not None:
+            consistent = self.nogoods.propagate(problem)
+            if not consistent or not problem.changed_variables:
+                break
+            self.statistics.propagations += 1
+            consistent = problem.constraint_propagation(self.optimized)
+
+        return consistent
+
+    def backjump(self, conflict):
+        """Jumps back to the deepest split in the conflict.
+
+        The splits deeper than that are dropped without trying their
+        other values, the conflict is added to the conflict of that split.
+        Without backjumping only the conflict is added to the last split."""
+
+        choice_points = self.choice_points
+        while choice_points:
+            level_bit = 1 << len(choice_points)
+            if conflict & level_bit or not self.backjumping:
+                choice_points[-1].conflict |= conflict & ~level_bit
+                return
+            choice_points.pop()
+            self.statistics.backjumps += 1
+
+    def learn(self, conflict):
+        """Adds the assignments of the splits in the conflict to the nogoods."""
+
+        nogood = []
+        for level, choice_point in enumerate(self.choice_points, 1):
+            if conflict >> level & 1:
+                nogood.append((choice_point.variable, choice_point.values[choice_point.index - 1]))
+
+        self.nogoods.add(nogood)
+
+    def split_off(self):
+        """Takes the untried values of the topmost split away from the search.
+
+        Returns the decisions leading from the start of this search to every
+        subtree that was taken away, as lists of (variable, value) pairs.
+        The search will not visit those subtrees anymore.
+        Returns an empty list if there is nothing to take."""
+
+        path = []
+        for choice_point in self.choice_points:
+            untried = choice_point.values[choice_point.index:]
+            if untried:
+                choice_point.values = choice_point.values[:choice_point.index]
+                return [path + [(choice_point.variable, value)] for value in untried]
+            path.append((choice_point.variable, choice_point.values[choice_point.index - 1]))
+
+        return []
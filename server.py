@@ -0,0 +1,361 @@
+#! /usr/bin/env python
+
+# File: server
+# A long running solver answering requests on a local socket.
+# Authors:  Georgi Terziev      g.d.terziev@gmail.com
+#           Kasper Bouwens      kas_bouwens@hotmail.com
+
+import os
+import sys
+import stat
+import errno
+import json
+import time
+import Queue
+import signal
+import socket
+import argparse
+import threading
+import SocketServer
+import multiprocessing
+from sudoku import Sudoku
+from csproblem import CSProblem
+from constraints import Different, AllDifferent
+from search import SOLVED, UNSATISFIABLE, SUSPENDED
+from restarts import UNKNOWN
+from stats import SolverStatistics
+from cspsolver import create_search
+
+ERROR = 'error'
+"""The status of a request that could not be solved because it is wrong."""
+
+CONSTRAINT_TYPES = {'different': Different, 'alldifferent': AllDifferent}
+"""The constraint types of the generic CSP requests, by name."""
+
+time_check_interval = 100
+"""The nodes searched between the checks of the timeout of a request."""
+
+worker_translators = None
+"""The sudoku translators of a worker process, by whether they use global constraints."""
+
+def initialize_worker(template_dir=None, sizes=(9,)):
+    """Creates the sudoku translators of a worker process, with their templates for sizes built."""
+
+    global worker_translators
+    #the server shuts the workers down, an interrupt of the terminal is for the server only
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker_translators = dict()
+    for global_constraints in (False, True):
+        translator = Sudoku(global_constraints, template_dir)
+        for size in sizes:
+            translator.get_template(size)
+        worker_translators[global_constraints] = translator
+
+def create_problem(request):
+    """Returns the CSProblem of a request and the function translating its solutions.
+
+    A sudoku request has the sudoku string as 'sudoku', and it is translated
+    with global constraints if 'global_constraints' is set. Its solutions
+    are translated to sudoku strings.
+    A generic request has a 'csp' with the list of the 'domains' of the
+    variables and the list of the 'constraints', each with a 'type'
+    (see CONSTRAINT_TYPES, 'different' if not given) and the list of its
+    'variables'. Its solutions are translated to the lists of the values
+    of the variables."""
+
+    if 'sudoku' in request:
+        translator = worker_translators[bool(request.get('global_constraints'))]
+        return translator.translate_sudoku_to_CSP(request['sudoku']), translator.translate_solution
+
+    if 'csp' not in request:
+        raise Exception('create_problem', "A request needs a 'sudoku' or a 'csp'")
+
+    csp = request['csp']
+    problem = CSProblem()
+    problem.set_variables(dict((variable, set(domain)) for variable, domain in enumerate(csp['domains'])))
+    constraints = []
+    for constraint in csp['constraints']:
+        constraint_type = CONSTRAINT_TYPES.get(constraint.get('type', 'different'))
+        if constraint_type is None:
+            raise Exception('create_problem', 'Unknown constraint type: ' + str(constraint['type']))
+        constraints.append((constraint_type(), list(constraint['variables'])))
+    problem.set_constraints(constraints)
+
+    def translate_solution(solution):
+        return [solution[variable].pop() for variable in range(len(solution))]
+
+    return problem, translate_solution
+
+def search_until(search, deadline):
+    """Runs a search.Search or dlx.ExactCover until it is over or the deadline passed.
+
+    deadline is a time.time(), None for no deadline.
+    Returns the status of the search, or UNKNOWN if the deadline passed."""
+
+    if deadline is None:
+        return search.run()
+
+    while True:
+        status = search.step(time_check_interval)
+        if status != SUSPENDED:
+            return status
+        if time.time() >= deadline:
+            return UNKNOWN
+
+def serve_request(request, received, deadline):
+    """Solves a request in a worker process and returns the response, see SolverServer.
+
+    received is the time.time() the server got the request at."""
+
+    statistics = SolverStatistics()
+    response = {'queue_time': time.time() - received}
+    try:
+        problem, translate_solution = create_problem(request)
+        search = create_search(problem, request.get('exact_cover', True), statistics=statistics)
+        count_limit = request.get('count')
+        if count_limit is None:
+            status = search_until(search, deadline)
+            if status == SOLVED:
+                response['solution'] = translate_solution(search.solution)
+        else:
+            count = 0
+            status = UNSATISFIABLE
+            while count < count_limit:
+                search.resume()
+                status = search_until(search, deadline)
+                if status != SOLVED:
+                    break
+                count += 1
+                #a solution can come before the search is suspended for the deadline check
+                if deadline is not None and time.time() >= deadline and count < count_limit:
+                    status = UNKNOWN
+                    break
+            if status != UNKNOWN:
+                status = SOLVED if count > 0 else UNSATISFIABLE
+            response['count'] = count
+        response['status'] = status
+    except Exception as error:
+        response['status'] = ERROR
+        response['error'] = ' '.join(map(str, error.args))
+    response['statistics'] = statistics.as_dict()
+
+    return response
+
+class Dispatcher:
+    """Solves the requests with a pool of processes.
+
+    Every request is a task of its own, so a slow request only holds up the
+    worker solving it. The workers keep their sudoku translators and
+    templates between the tasks."""
+
+    def __init__(self, workers, template_dir=None, timeout=None):
+        self.timeout = timeout
+        self.pool = multiprocessing.Pool(workers, initialize_worker, (template_dir,))
+
+    def submit(self, connection, request):
+        """Sends a request of a connection to the pool, its response goes to connection.respond."""
+
+        received = time.time()
+        deadline = None
+        timeout = request.get('timeout', self.timeout)
+        count = request.get('count')
+        connection.expect_response()
+        if timeout is not None:
+            if not isinstance(timeout, (int, long, float)):
+                connection.respond({'id': request.get('id'), 'status': ERROR, 'error': 'The timeout must be a number'})
+                return
+            deadline = received + timeout
+        if count is not None and (isinstance(count, bool) or not isinstance(count, (int, long)) or count < 1):
+            connection.respond({'id': request.get('id'), 'status': ERROR, 'error': 'The count must be a positive integer'})
+            return
+
+        def deliver(response):
+            self.deliver(connection, request, response, received)
+
+        self.pool.apply_async(serve_request, (request, received, deadline), callback=deliver)
+
+    def deliver(self, connection, request, response, received):
+        """Hands the response of a request to its connection.
+
+        Runs on the result thread of the pool, the connection writes
+        the response on a thread of its own."""
+
+        if 'id' in request:
+            response['id'] = request['id']
+        response['wall_time'] = time.time() - received
+        connection.respond(response)
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+class ConnectionHandler(SocketServer.StreamRequestHandler):
+    """Reads the requests of a connection, one JSON object per line.
+
+    The responses are written as they are ready, one JSON object per line,
+    so they need not come in the order of the requests. They are written
+    by a thread of the connection, so a slow client only holds up its own
+    responses. The connection is closed after the client closed its side
+    and got all its responses."""
+
+    def handle(self):
+        self.pending = 0
+        self.answered = threading.Condition()
+        self.responses = Queue.Queue()
+        writer = threading.Thread(target=self.write_responses)
+        writer.daemon = True
+        writer.start()
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError:
+                request = None
+            if not isinstance(request, dict):
+                self.expect_response()
+                self.respond({'status': ERROR, 'error': 'A request must be a JSON object'})
+                continue
+            self.server.dispatcher.submit(self, request)
+
+        with self.answered:
+            while self.pending:
+                self.answered.wait()
+        self.responses.put(None)
+        writer.join()
+
+    def expect_response(self):
+        """Counts a response that has to be written before the connection is closed."""
+
+        with self.answered:
+            self.pending += 1
+
+    def respond(self, response):
+        """Queues a response for the writer thread of the connection."""
+
+        self.responses.put(response)
+
+    def write_responses(self):
+        """Writes the queued responses until a None is queued."""
+
+        while True:
+            response = self.responses.get()
+            if response is None:
+                return
+            line = json.dumps(response, sort_keys=True) + '\n'
+            try:
+                self.wfile.write(line)
+                self.wfile.flush()
+            except socket.error:
+                #the client is gone, the other responses are dropped the same way
+                pass
+            with self.answered:
+                self.pending -= 1
+                self.answered.notify()
+
+class SolverServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """A solver service on a TCP socket.
+
+    Every request is a JSON object, a sudoku or a generic CSP
+    (see create_problem) with these optional fields:
+    id                 - copied to the response.
+    global_constraints - translate the sudoku with global constraints.
+    exact_cover        - false to search with constraint propagation,
+                         see cspsolver.create_search.
+    count              - count the solutions up to this number instead,
+                         2 checks that the solution is unique. When the
+                         timeout passes the count so far is answered.
+    timeout            - give up after this many seconds from receiving
+                         the request (the default is the one of the server).
+    The response has the status (solved, unsatisfiable, unknown if the
+    timeout passed, or error with the 'error' message), the solution or the
+    count of solutions, the statistics of the search, and the seconds the
+    request waited for a worker (queue_time) and until its response (wall_time)."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, dispatcher):
+        SocketServer.TCPServer.__init__(self, address, ConnectionHandler)
+        self.dispatcher = dispatcher
+
+def is_stale_socket(path):
+    """Tells if the Unix socket at path was left by a server that is gone.
+
+    It is if a connection to it is refused, other errors are raised."""
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error as error:
+        if error.errno == errno.ECONNREFUSED:
+            return True
+        raise
+    finally:
+        probe.close()
+
+    return False
+
+class UnixSolverServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """The solver service of SolverServer on a Unix socket.
+
+    A socket left at the path by a server that did not shut down is
+    replaced, a path in use by a running server or not a socket is refused."""
+
+    daemon_threads = True
+
+    def __init__(self, path, dispatcher):
+        if os.path.exists(path):
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                raise Exception('UnixSolverServer', path + ' exists and is not a socket')
+            if not is_stale_socket(path):
+                raise Exception('UnixSolverServer', 'A server is already listening on ' + path)
+            os.remove(path)
+        SocketServer.UnixStreamServer.__init__(self, path, ConnectionHandler)
+        self.dispatcher = dispatcher
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='server.py', description='Solves sudokus and CSPs sent to a local socket, '
+                                     'one JSON request per line.')
+    parser.add_argument('--socket', metavar='PATH', help='listen on a Unix socket at PATH instead of TCP')
+    parser.add_argument('--host', default='127.0.0.1', help='the address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='the TCP port to listen on, 0 for any free port')
+    parser.add_argument('-j', '--workers', type=int, default=0,
+                        help='number of worker processes (default 0, one per CPU)')
+    parser.add_argument('--template-dir', metavar='DIR',
+                        help='load the sudoku constraint templates from DIR and store them there')
+    parser.add_argument('--timeout', type=float,
+                        help='the default timeout of a request in seconds')
+    args = parser.parse_args(argv[1:])
+
+    workers = args.workers
+    if workers == 0:
+        workers = multiprocessing.cpu_count()
+
+    dispatcher = Dispatcher(workers, args.template_dir, args.timeout)
+    if args.socket is not None:
+        server = UnixSolverServer(args.socket, dispatcher)
+        print >> sys.stderr, 'Listening on %s' % args.socket
+    else:
+        server = SolverServer((args.host, args.port), dispatcher)
+        print >> sys.stderr, 'Listening on %s:%d' % server.server_address
+    sys.stderr.flush()
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        dispatcher.close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,258 @@
+#! /usr/bin/env python
+
+# File: solutioncache
+# A cache of sudoku solutions shared by all the puzzles equivalent under the sudoku symmetries.
+# Authors:  Georgi Terziev      g.d.terziev@gmail.com
+#           Kasper Bouwens      kas_bouwens@hotmail.com
+
+import os
+import math
+import cPickle
+import threading
+import itertools
+from collections import OrderedDict
+from sudoku import Sudoku
+
+UNSATISFIABLE = None
+"""The cached solution of a sudoku without a solution."""
+
+def line_orders(invariants, box, limit):
+    """Returns the orders of the rows (or columns) to try for the canonical form.
+
+    The bands are ordered by the sorted invariants of their lines and the
+    lines of a band by their invariants. Every order of the lines and bands
+    that tie is returned, unless there are more than limit of them,
+    then only the order of the sort is."""
+
+    band_options = []
+    for band in range(box):
+        lines = sorted(range(band * box, (band + 1) * box), key=lambda line: invariants[line])
+        groups = [list(group) for key, group in itertools.groupby(lines, key=lambda line: invariants[line])]
+        band_options.append((tuple(sorted(invariants[line] for line in lines)), groups))
+
+    bands = sorted(range(box), key=lambda band: band_options[band][0])
+    band_groups = [list(group) for key, group in itertools.groupby(bands, key=lambda band: band_options[band][0])]
+
+    count = 1
+    for key, groups in band_options:
+        for group in groups:
+            count *= math.factorial(len(group))
+    for group in band_groups:
+        count *= math.factorial(len(group))
+    if count > limit:
+        return [[line for band in bands for group in band_options[band][1] for line in group]]
+
+    def band_orders(band):
+        return [list(itertools.chain(*order)) for order in itertools.product(*map(itertools.permutations, band_options[band][1]))]
+
+    orders = []
+    for band_order in itertools.product(*map(itertools.permutations, band_groups)):
+        band_order = list(itertools.chain(*band_order))
+        for line_order in itertools.product(*map(band_orders, band_order)):
+            orders.append(list(itertools.chain(*line_order)))
+
+    return orders
+
+class Transformation:
+    """A symmetry of the sudokus of a size.
+
+    The cell (row, column) of the transformed grid holds the value of the
+    cell (rows[row], columns[column]) of the original grid, transposed
+    first if transpose is set, relabeled by labels (a list mapping values
+    to the new values, with labels[0] == 0 for the unset cells)."""
+
+    def __init__(self, size, transpose, rows, columns, labels):
+        self.size = size
+        self.transpose = transpose
+        self.rows = rows
+        self.columns = columns
+        self.labels = labels
+
+    def cells(self):
+        """Returns the list mapping the transformed cells to the original ones."""
+
+        size = self.size
+        cells = []
+        for row in self.rows:
+            for column in self.columns:
+                if self.transpose:
+                    cells.append(column * size + row)
+                else:
+                    cells.append(row * size + column)
+
+        return cells
+
+    def apply(self, values):
+        labels = self.labels
+        return [labels[values[cell]] for cell in self.cells()]
+
+    def invert(self, values):
+        """Returns the original values of the transformed values."""
+
+        originals = [0] * len(self.labels)
+        for value, label in enumerate(self.labels):
+            originals[label] = value
+
+        result = [0] * len(values)
+        for cell, original_cell in enumerate(self.cells()):
+            result[original_cell] = originals[values[cell]]
+
+        return result
+
+class SolutionCache:
+    """A bounded LRU store of sudoku solutions, keyed by a canonical form of the puzzles.
+
+    Puzzles that are the same up to relabeling the values, permuting the
+    rows within a band, the bands, the columns within a stack, the stacks,
+    and transposing, usually get the same canonical form (see canonical_form),
+    so solving one of them solves all. A cached solution is stored in the
+    orientation of the canonical form and mapped back to the orientation
+    of every puzzle looked up.
+
+    The canonical form is the transformed puzzle itself, so a lookup is
+    correct even when two equivalent puzzles get different forms:
+    then both are solved and cached.
+
+    With a path the cache is loaded from there and saved there by save.
+    The cache can be used by several threads."""
+
+    def __init__(self, capacity=100000, path=None, tie_limit=64):
+        self.capacity = capacity
+        self.path = path
+        self.tie_limit = tie_limit
+        self.solutions = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as cache_file:
+                self.solutions = OrderedDict(cPickle.load(cache_file))
+
+    def __len__(self):
+        return len(self.solutions)
+
+    def canonical_form(self, values):
+        """Returns the canonical form of a sudoku and the Transformation leading to it.
+
+        values are the values of the cells, 0 for the unset ones.
+        Orders the rows, columns, bands and stacks by invariants of the
+        symmetries: the number of givens of a line, the frequencies of its
+        values in the whole puzzle and the number of givens in the lines
+        crossing its givens. The lines that tie are tried in every order,
+        up to tie_limit orders, and both orientations. The values are
+        relabeled in the order of their first appearance. The smallest
+        of the resulting puzzles is the canonical form."""
+
+        ncells = len(values)
+        size = int(round(math.sqrt(ncells)))
+        box = int(round(math.sqrt(size)))
+        frequencies = [0] * (size + 1)
+        for value in values:
+            frequencies[value] += 1
+
+        best = None
+        for transpose in (False, True):
+            if transpose:
+                grid = [values[column * size + row] for row in range(size) for column in range(size)]
+            else:
+                grid = values
+            row_counts = [sum(1 for column in range(size) if grid[row * size + column]) for row in range(size)]
+            column_counts = [sum(1 for row in range(size) if grid[row * size + column]) for column in range(size)]
+            row_invariants = []
+            for row in range(size):
+                givens = [column for column in range(size) if grid[row * size + column]]
+                row_invariants.append((len(givens),
+                                       sorted(frequencies[grid[row * size + column]] for column in givens),
+                                       sorted(column_counts[column] for column in givens)))
+            column_invariants = []
+            for column in range(size):
+                givens = [row for row in range(size) if grid[row * size + column]]
+                column_invariants.append((len(givens),
+                                          sorted(frequencies[grid[row * size + column]] for row in givens),
+                                          sorted(row_counts[row] for row in givens)))
+
+            row_orders = line_orders(row_invariants, box, self.tie_limit)
+            column_orders = line_orders(column_invariants, box, max(self.tie_limit / len(row_orders), 1))
+            for rows in row_orders:
+                for columns in column_orders:
+                    arranged = [grid[row * size + column] for row in rows for column in columns]
+                    labels = [0] * (size + 1)
+                    next_label = 1
+                    for value in arranged:
+                        if value and not labels[value]:
+                            labels[value] = next_label
+                            next_label += 1
+                    #the values missing from the puzzle are interchangeable, label them in order
+                    for value in range(1, size + 1):
+                        if not labels[value]:
+                            labels[value] = next_label
+                            next_label += 1
+                    form = tuple(labels[value] for value in arranged)
+                    if best is None or form < best[0]:
+                        best = (form, Transformation(size, transpose, rows, columns, labels))
+
+        return best
+
+    def lookup(self, sudoku_string):
+        """Looks up the solution of a sudoku.
+
+        Returns the canonical form of the sudoku, its transformation, whether
+        it was found and its solution string (UNSATISFIABLE for no solution)."""
+
+        values = [0 if character in Sudoku.unset_values else Sudoku.value_characters.find(character.upper()) + 1
+                  for character in sudoku_string]
+        form, transformation = self.canonical_form(values)
+        found, solution_string = self.find(form, transformation)
+        return form, transformation, found, solution_string
+
+    def find(self, form, transformation, late=False):
+        """Looks up the solution of a sudoku by its canonical form and transformation.
+
+        Returns whether it was found and its solution string (UNSATISFIABLE for no solution).
+        late means that lookup counted the sudoku as a miss, but an equivalent
+        sudoku was being solved at the time, then it counts as a hit if found."""
+
+        with self.lock:
+            found = form in self.solutions
+            if found:
+                solution = self.solutions.pop(form)
+                self.solutions[form] = solution
+                self.hits += 1
+                if late:
+                    self.misses -= 1
+            elif not late:
+                self.misses += 1
+        if not found or solution is UNSATISFIABLE:
+            return found, UNSATISFIABLE
+
+        characters = Sudoku.value_characters
+        return True, ''.join(characters[value - 1] for value in transformation.invert(solution))
+
+    def store(self, form, transformation, solution_string):
+        """Caches the solution string of the sudoku with the canonical form and transformation.
+
+        UNSATISFIABLE stands for a sudoku without a solution."""
+
+        solution = UNSATISFIABLE
+        if solution_string is not UNSATISFIABLE:
+            values = [Sudoku.value_characters.find(character) + 1 for character in solution_string]
+            solution = tuple(transformation.apply(values))
+
+        with self.lock:
+            self.solutions.pop(form, None)
+            self.solutions[form] = solution
+            while len(self.solutions) > self.capacity:
+                self.solutions.popitem(False)
+
+    def save(self):
+        """Writes the cache to its path, if it has one."""
+
+        if self.path is None:
+            return
+
+        with self.lock:
+            items = self.solutions.items()
+        temporary_path = '%s.%d' % (self.path, os.getpid())
+        with open(temporary_path, 'wb') as cache_file:
+            cPickle.dump(items, cache_file, cPickle.HIGHEST_PROTOCOL)
+        os.rename(temporary_path, self.path)
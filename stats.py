@@ -0,0 +1,89 @@
+#! /usr/bin/env python
+
+# File: stats
+# Counters, timers and hooks of a single solve.
+# Authors:  Georgi Terziev      g.d.terziev@gmail.com
+#           Kasper Bouwens      kas_bouwens@hotmail.com
+
+import json
+
+COUNTERS = ['nodes', 'splits', 'failures', 'backtracks', 'backjumps', 'restarts', 'propagations',
+            'propagation_passes', 'revisions', 'domain_reductions', 'constraints_deleted']
+
+PHASES = ['propagation', 'selection', 'backtracking', 'learning']
+
+class SolverStatistics:
+    """The statistics of a solve.
+
+    Counters:
+    nodes               - the nodes of the search tree visited.
+    splits              - the values tried for split variables.
+    failures            - the nodes whose propagation failed.
+    backtracks          - the splits resumed with their next value.
+    backjumps           - the splits dropped by backjumping.
+    restarts            - the restarts of a restarts.RestartingSearch.
+    propagations        - the calls of the constraint propagation.
+    propagation_passes  - the passes over the constraints, see
+                          CSProblem.constraint_propagation.
+    revisions           - the calls of constraint filtering functions.
+    domain_reductions   - the domains narrowed by propagation.
+    constraints_deleted - the satisfied constraints deleted by the
+                          optimized propagation.
+
+    With timing the time spent in every phase of PHASES is measured too,
+    in seconds. The search time is always measured.
+
+    The hooks are called, if given, as on_node(search, problem) when a node
+    is entered, on_failure(search, problem) when its propagation fails and
+    on_solution(search, solution) when a solution is found."""
+
+    def __init__(self, timing=False, on_node=None, on_failure=None, on_solution=None):
+        for counter in COUNTERS:
+            setattr(self, counter, 0)
+        self.timing = timing
+        self.phase_times = dict((phase, 0.0) for phase in PHASES)
+        self.time = 0.0
+        self.on_node = on_node
+        self.on_failure = on_failure
+        self.on_solution = on_solution
+
+    def __getstate__(self):
+        #the hooks stay in the process that set them
+        state = self.__dict__.copy()
+        state['on_node'] = state['on_failure'] = state['on_solution'] = None
+        return state
+
+    def merge(self, other):
+        """Adds the counters and times of other to these."""
+
+        for counter in COUNTERS:
+            setattr(self, counter, getattr(self, counter) + getattr(other, counter))
+        for phase in PHASES:
+            self.phase_times[phase] += other.phase_times[phase]
+        self.time += other.time
+
+    def merge_dict(self, record):
+        """Adds the counters and times of a dict returned by as_dict to these."""
+
+        for counter in COUNTERS:
+            setattr(self, counter, getattr(self, counter) + record.get(counter, 0))
+        for phase, phase_time in record.get('phase_times', dict()).iteritems():
+            self.phase_times[phase] += phase_time
+        self.time += record.get('time', 0.0)
+
+    def as_dict(self):
+        """Returns the counters and the times as a dict."""
+
+        statistics = dict((counter, getattr(self, counter)) for counter in COUNTERS)
+        statistics['time'] = self.time
+        if self.timing:
+            statistics['phase_times'] = dict(self.phase_times)
+
+        return statistics
+
+    def to_json(self, **fields):
+        """Returns the statistics as a line of JSON, with the extra fields added."""
+
+        record = self.as_dict()
+        record.update(fields)
+        return json.dumps(record, sort_keys=True)
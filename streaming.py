@@ -0,0 +1,158 @@
+#! /usr/bin/env python
+
+# File: streaming
+# Block-buffered reading and writing of sudoku files, with checkpoints.
+# Authors:  Georgi Terziev      g.d.terziev@gmail.com
+#           Kasper Bouwens      kas_bouwens@hotmail.com
+
+import os
+import sys
+import json
+import threading
+from collections import deque
+
+STANDARD_STREAM = '-'
+"""The file name standing for stdin or stdout."""
+
+class LineReader:
+    """Reads the lines of a file in large blocks.
+
+    Iterating gives the lines without their line ends. The offset of the
+    end of every line given is appended to offsets, so that a consumer that
+    finishes the lines in order can tell how far into the input it got."""
+
+    def __init__(self, input_file, offset=0, block_size=1 << 20):
+        self.input_file = input_file
+        self.block_size = block_size
+        self.offset = offset
+        self.offsets = deque()
+
+    def __iter__(self):
+        descriptor = self.input_file.fileno()
+        if self.offset:
+            os.lseek(descriptor, self.offset, os.SEEK_SET)
+
+        rest = ''
+        offset = self.offset
+        while True:
+            block = os.read(descriptor, self.block_size)
+            if not block:
+                break
+            lines = (rest + block).split('\n')
+            rest = lines.pop()
+            for line in lines:
+                offset += len(line) + 1
+                self.offsets.append(offset)
+                yield line.rstrip('\r')
+
+        if rest:
+            self.offsets.append(offset + len(rest))
+            yield rest.rstrip('\r')
+
+class ReadAhead:
+    """An iterator over lines that does not run too far ahead of their consumer.
+
+    At most limit lines are given out that were not reported done yet.
+    multiprocessing.Pool.imap reads its whole input in a thread of its own,
+    this keeps it from loading a huge input file into memory."""
+
+    def __init__(self, lines, limit):
+        self.lines = iter(lines)
+        self.limit = limit
+        self.slots = threading.Semaphore(limit)
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        self.slots.acquire()
+        if self.closed:
+            raise StopIteration
+        return next(self.lines)
+
+    def done(self):
+        """Reports that the consumer is done with a line."""
+
+        self.slots.release()
+
+    def close(self):
+        """Ends the iteration, also for a reader waiting for a slot."""
+
+        self.closed = True
+        for slot in range(self.limit):
+            self.slots.release()
+
+class SolutionWriter:
+    """Writes lines to a file in batches of batch_size lines."""
+
+    def __init__(self, output_file, batch_size=256):
+        self.output_file = output_file
+        self.batch_size = batch_size
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+        if len(self.lines) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered lines and flushes the file."""
+
+        if self.lines:
+            self.lines.append('')
+            self.output_file.write('\n'.join(self.lines))
+            self.lines = []
+        self.output_file.flush()
+
+class Checkpoint:
+    """A file recording how far a run got, to resume it after an interruption.
+
+    The state is a dict, saved as JSON. It is written to a temporary file
+    that is then renamed, so that an interrupted save leaves the last
+    checkpoint intact."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Returns the saved state, or None if there is no checkpoint."""
+
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path, 'r') as checkpoint_file:
+            return json.load(checkpoint_file)
+
+    def save(self, state):
+        temporary_path = '%s.%d' % (self.path, os.getpid())
+        with open(temporary_path, 'w') as checkpoint_file:
+            json.dump(state, checkpoint_file, sort_keys=True)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.rename(temporary_path, self.path)
+
+def open_input(path):
+    """Opens a file for reading, stdin for STANDARD_STREAM."""
+
+    if path == STANDARD_STREAM:
+        return sys.stdin
+
+    return open(path, 'rb')
+
+def open_output(path, offset=None):
+    """Opens a file for writing, stdout for STANDARD_STREAM.
+
+    With an offset the file is kept up to the offset and written from
+    there, dropping what was written after it."""
+
+    if path == STANDARD_STREAM:
+        return sys.stdout
+
+    if offset is None:
+        return open(path, 'wb')
+
+    output_file = open(path, 'r+b')
+    output_file.truncate(offset)
+    output_file.seek(offset)
+    return output_file
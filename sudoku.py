@@ -6,8 +6,10 @@
 #           Kasper Bouwens      kas_bouwens@hotmail.com
 
 import math
-from constraints import Different
-from csproblem import CSProblem
+import os
+import cPickle
+from constraints import Different, AllDifferent
+from csproblem import CSProblem, ConstraintTemplate
 
 class Sudoku:
     """A Sudoku puzzle.
@@ -17,8 +19,25 @@ class Sudoku:
     unset_values = {'0', '.'}
     """The characters that can be used for unset variable."""
 
+    value_characters = '123456789ABCDEFGHIJKLMNOP'
+    """The characters of the values 1, 2, ... of sudokus up to 25x25."""
+
     constraint_type = Different()
 
+    def __init__(self, global_constraints=False, template_dir=None):
+        """Creates a translator.
+
+        With global_constraints every row, column and box is a single
+        AllDifferent constraint, otherwise the sudoku rules are split
+        into binary Different constraints.
+        The constraints are built once per sudoku size and shared by all
+        the translated problems. If template_dir is given they are also
+        stored there and loaded from there by later translators."""
+
+        self.global_constraints = global_constraints
+        self.template_dir = template_dir
+        self.templates = dict()
+
     def translate_sudoku_to_CSP(self, sudoku_string):
         """Translates a sudoku string to CSProblem
 
@@ -40,21 +59,80 @@ class Sudoku:
         if subgrid_size != int(subgrid_size):
             raise Execption(context, message)
 
-        domain = set()
-        for value in range(1, size+1):
-            domain.add(value)
+        return self.create_CSP(size, self.initialize_domain_masks(sudoku_string, size))
 
-        variables = self.initialize_variables(sudoku_string, domain)
-        
-        #constraints = self.generate_sudoku_rules_constraints(size)
-        constraints = self.generate_sudoku_rules_constraints_binary(size)
+    def create_CSP(self, size, domain_masks):
+        """Creates the CSProblem of a sudoku from the domains of its cells.
+
+        Bit i of a domain mask stands for value i+1."""
 
         csp = CSProblem()
-        csp.set_variables(variables)
-        csp.set_constraints(constraints)
+        csp.set_domain_masks(range(1, size+1), domain_masks)
+        csp.set_constraint_template(self.get_template(size))
 
         return csp
 
+    def initialize_domain_masks(self, sudoku_string, size):
+        """Returns the domains of the variables of a sudoku puzzle as bitmasks.
+
+        Same as initialize_variables, but bit i of a mask stands for value i+1."""
+
+        full_domain = (1 << size) - 1
+        domain_masks = []
+        for value in sudoku_string:
+            if value not in self.unset_values:
+                domain_masks.append(1 << (self.character_value(value) - 1))
+            else:
+                domain_masks.append(full_domain)
+
+        return domain_masks
+
+    def character_value(self, character):
+        """Returns the value written as the given character.
+
+        The values above 9 are written as letters, A for 10 up to P for 25."""
+
+        value = self.value_characters.find(character.upper()) + 1
+        if value == 0:
+            raise Exception('character_value', 'Not a sudoku value: ' + repr(character))
+
+        return value
+
+    def get_template(self, size):
+        """Returns the constraint template for sudokus of the given size.
+
+        Builds it on first use, or loads it from template_dir if it was stored there."""
+
+        template = self.templates.get(size)
+        if template is not None:
+            return template
+
+        path = None
+        if self.template_dir is not None:
+            kind = 'global' if self.global_constraints else 'binary'
+            path = os.path.join(self.template_dir, 'sudoku%d-%s.template' % (size, kind))
+            if os.path.exists(path):
+                with open(path, 'rb') as template_file:
+                    template = cPickle.load(template_file)
+
+        if template is None:
+            if self.global_constraints:
+                constraints = self.generate_sudoku_rules_constraints(size, AllDifferent)
+            else:
+                constraints = self.generate_sudoku_rules_constraints_binary(size)
+            #the rows, columns and boxes, for solvers that use them directly (see dlx)
+            groups = [variables for constraint_type, variables in self.generate_sudoku_rules_constraints(size)]
+            template = ConstraintTemplate(constraints, size * size, groups)
+            if path is not None:
+                #write to a temporary file first, so that a reader never sees half a template
+                temporary_path = '%s.%d' % (path, os.getpid())
+                with open(temporary_path, 'wb') as template_file:
+                    cPickle.dump(template, template_file, cPickle.HIGHEST_PROTOCOL)
+                os.rename(temporary_path, path)
+
+        self.templates[size] = template
+        return template
+
     def initialize_variables(self, sudoku_string, domain):
         """Initializes the variables of a sudoku puzzle
 
@@ -68,14 +146,24 @@ class Sudoku:
         #NOTE: variables are 0-based
         for variable, value in enumerate(sudoku_string):
             if value not in self.unset_values:
-                int_value = int(value)
+                int_value = self.character_value(value)
                 variables[variable] = {int_value}
             else:
                 variables[variable] = domain.copy()
 
         return variables
 
-    def generate_sudoku_rules_constraints(self, size):
+    def generate_sudoku_rules_constraints(self, size, constraint_class=None):
+        """Generate one constraint for every row, column and box.
+
+        Without constraint_class all the constraints share constraint_type,
+        otherwise every constraint gets its own instance of constraint_class."""
+
+        def new_constraint_type():
+            if constraint_class is None:
+                return self.constraint_type
+            return constraint_class()
+
         constraints = []
         for row in range(0, size):
             same_row = []
@@ -83,8 +171,8 @@ class Sudoku:
             for col in range(0, size):
                 same_row.append(row * size + col)
                 same_col.append(col * size + row)
-            constraints.append((self.constraint_type, same_row))
-            constraints.append((self.constraint_type, same_col))
+            constraints.append((new_constraint_type(), same_row))
+            constraints.append((new_constraint_type(), same_col))
 
         quadrant_size = int(math.sqrt(size))
         for quadrant_x in range(0, quadrant_size):
@@ -95,7 +183,7 @@ class Sudoku:
                         row = quadrant_x * quadrant_size + x
                         col = quadrant_y * quadrant_size + y
                         same_quadrant.append(row * size + col)
-                constraints.append((self.constraint_type, same_quadrant))
+                constraints.append((new_constraint_type(), same_quadrant))
         
         return constraints
 
@@ -107,16 +195,17 @@ class Sudoku:
         that the two variables should have different values."""
         
         constraints = []
+        added = set()
         for i in range(0, size*size):
             row = i / size
             column = i % size
             for r in range(0, size):
                 same_row_var = row * size + r
                 if same_row_var != i:
-                    self.add_constraint(constraints, i, same_row_var)
+                    self.add_constraint(constraints, i, same_row_var, added)
                 same_col_var = r * size + column
                 if same_col_var != i:
-                    self.add_constraint(constraints, i, same_col_var)
+                    self.add_constraint(constraints, i, same_col_var, added)
             
             quadrant_size = int(math.sqrt(size))
             quadrant_x = int(row / quadrant_size)
@@ -125,22 +214,24 @@ class Sudoku:
                 for y in range(quadrant_y * quadrant_size, (quadrant_y + 1) * quadrant_size):
                     var = x * size + y
                     if var != i:
-                        self.add_constraint(constraints, var, i) 
+                        self.add_constraint(constraints, var, i, added)
 
         return constraints
             
 
-    def add_constraint(self, constraints, var1, var2):
+    def add_constraint(self, constraints, var1, var2, added):
         """Adds a constraint to the problem.
 
         Given two variables, add them as a pair in the constraints,
         signifying that they should have different values.
-        For uniqueness the pair alwas has the smalles variable as first."""
+        For uniqueness the pair alwas has the smalles variable as first,
+        and pairs already in the set added are skipped."""
 
         variables = sorted([var1, var2])
-        constraint = (self.constraint_type, variables)
-        if not constraint in constraints:
-            constraints.append(constraint)
+        pair = (variables[0], variables[1])
+        if not pair in added:
+            added.add(pair)
+            constraints.append((self.constraint_type, variables))
 
     def translate_solution(self, variables):
         """Returns the solution to the sudoku as a printable string.
@@ -152,7 +243,7 @@ class Sudoku:
         for variable, domain in sorted_variables:
             value = domain.pop()
             domain.add(value)
-            solution += str(value)
+            solution += self.value_characters[value - 1]
             
         return solution
 